@@ -15,18 +15,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-
-# For demo purposes we just turn off the HTTPS warnings.
-# With real usage setting up the certificates for secure
-# requests is highly recommended.
-import requests.packages.urllib3
-requests.packages.urllib3.disable_warnings()
-
 import argparse
 import pprint
 
-# Import the python rest-client in the python 3.x style
-from purestorage import purestorage
+# Optional read cache on top of the FlashArray sessions, which are only imported once we connect
+import cache
+
+# Machine readable output and profiling
+import output
+import profiling
 
 
 def basic_info(array):
@@ -53,30 +50,50 @@ def space_info(array):
 
 def main(args):
     # The FlashArray object is the main entry point for the Python Rest Client. All interaction
-    # With the array is done through these objects.
-    array = purestorage.FlashArray(args.target, username=args.username, password=args.password)
+    # With the array is done through these objects, we get ours from the shared session cache.
+    import sessions
+    array = sessions.get_array(args.target, username=args.username, password=args.password)
+    if args.cache_file:
+        array = cache.CachedFlashArray(array, path=args.cache_file)
 
     # Run through all of our modules methods
-    basic_info = basic_info(array)
-    space_info = space_info(array)
+    basic = basic_info(array)
+    space = space_info(array)
+
+    if args.cache_file:
+        array.save()
+
+    if args.format != 'text':
+        record = dict(basic)
+        record.update(space)
+        output.write_records([record], args.format)
+        return
 
     print('')
     print('Basic info (raw):')
-    pprint.pprint(basic_info)
+    pprint.pprint(basic)
     print('')
     print('Space info (raw):')
-    pprint.pprint(space_info)
+    pprint.pprint(space)
     print('')
     print('Done!')
     print('')
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
     # Generic arguments to connect to the array
     parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
     parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
     parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+    parser.add_argument('--cache_file', help='File to cache read results in between runs against the same FlashArray.')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the results.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
-    main(args)
+    profiling.run(main, args)
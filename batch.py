@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+import time
+from concurrent import futures
+
+# Default number of operations we run against an array at the same time.
+DEFAULT_WORKERS = 8
+
+
+class Skipped(Exception):
+    """ Recorded for an operation that wasn't run because one it depends on failed."""
+
+
+class RateLimiter(object):
+    """ Spaces out calls so no more than rate of them start per second.
+
+    A rate of None (or 0) disables limiting.
+    """
+
+    def __init__(self, rate=None):
+        self._interval = 1.0 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """ Block until the caller is allowed to start its next call."""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_all(func, items, workers=DEFAULT_WORKERS, rate=None):
+    """ Call func once per item across a pool of worker threads.
+
+    One failing item doesn't stop the others, its exception is recorded instead.
+
+    Args:
+        func (callable): Called as func(item) for each item.
+        items (list): The items to process, they are used as the keys of the results.
+        workers (int): The maximum number of calls to run at once.
+        rate (float): The maximum number of calls started per second, or None for no limit.
+
+    Returns:
+        OrderedDict: Each item mapped to None if func succeeded or the exception it raised,
+                     in the same order as items.
+    """
+    limiter = RateLimiter(rate)
+
+    def limited(item):
+        limiter.wait()
+        func(item)
+
+    results = collections.OrderedDict()
+    with futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = [(item, executor.submit(limited, item)) for item in items]
+        for item, future in pending:
+            results[item] = future.exception()
+    return results
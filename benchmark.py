@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# The modules being measured, and the mock array we measure them against
+import array_info
+import health_check
+import hosts
+import mock_array
+import volumes
+
+
+def measure(name, func, state, memory=True):
+    """ Run func once against the mock array and measure it.
+
+    Args:
+        name (str): What to call this benchmark in the results.
+        func (callable): Does the work and returns the number of objects it processed.
+        state (MockArrayState): The mock array func talks to, used to count REST calls.
+        memory (bool): Whether to track peak memory, which slows the run down somewhat.
+
+    Returns:
+        dict: The name, wall time, REST call count, peak memory and objects per second.
+    """
+    state.reset_counts()
+    if memory:
+        tracemalloc.start()
+    start = time.time()
+    count = func()
+    elapsed = time.time() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'name': name,
+        'seconds': elapsed,
+        'requests': state.request_count,
+        'peak_bytes': peak,
+        'objects': count,
+        'objects_per_second': count / elapsed if elapsed else None,
+    }
+
+
+def benchmarks(array, state, workers):
+    """ The (name, func) pairs to measure, read-only ones first, then the ones changing the array."""
+    vol_names = list(state.volumes)
+    batch_size = min(len(vol_names), 100)
+
+    return [
+        ('array_info.basic_info', lambda: len([array_info.basic_info(array)])),
+        ('array_info.space_info', lambda: len([array_info.space_info(array)])),
+        ('volumes.list_all', lambda: len(volumes.list_all(array, True))),
+        ('volumes.iter_all', lambda: sum(1 for _ in volumes.iter_all(array, True))),
+        ('volumes.collect_stats', lambda: len(volumes.collect_stats(array))),
+        ('hosts.list_with_connections', lambda: len(hosts.list_with_connections(array))),
+        ('hosts.build_index', lambda: len(hosts.build_index(array).names)),
+        ('health_check.collect+analyze',
+         lambda: health_check.analyze(health_check.collect(array, workers))['host_count']),
+        ('volumes.bulk_create', lambda: len(volumes.bulk_create(
+            array, [('bench-{0:05d}'.format(i), '1G') for i in range(batch_size)], workers))),
+        ('volumes.bulk smarter_delete', lambda: len(volumes.bulk(
+            array, 'smarter_delete', vol_names[:batch_size], workers))),
+    ]
+
+
+def format_results(results):
+    """ Render the benchmark results as a table."""
+    lines = ['{0:<32} {1:>10} {2:>10} {3:>12} {4:>14}'.format('benchmark', 'seconds', 'requests',
+                                                              'peak MiB', 'objects/s')]
+    for result in results:
+        peak = '-' if result['peak_bytes'] is None else '{0:.1f}'.format(result['peak_bytes'] / 1024.0 ** 2)
+        rate = '-' if result['objects_per_second'] is None else '{0:.0f}'.format(result['objects_per_second'])
+        lines.append('{0:<32} {1:>10.3f} {2:>10} {3:>12} {4:>14}'.format(
+            result['name'], result['seconds'], result['requests'], peak, rate))
+    return '\n'.join(lines)
+
+
+# Command lines whose start up time we measure, relative to this directory. The first two are
+# the floor: starting python at all, and importing the REST client every module used to load.
+STARTUP_COMMANDS = [
+    ('python', ['-c', 'pass']),
+    ('import purestorage', ['-c', 'from purestorage import purestorage']),
+    ('array_info.py --help', ['array_info.py', '--help']),
+    ('hosts.py --help', ['hosts.py', '--help']),
+    ('volumes.py --help', ['volumes.py', '--help']),
+    ('health_check.py --help', ['health_check.py', '--help']),
+    ('pure.py --help', ['pure.py', '--help']),
+    ('pure.py volumes --help', ['pure.py', 'volumes', '--help']),
+]
+
+
+def measure_startup(repeat=5):
+    """ Time how long each of the STARTUP_COMMANDS takes to start and exit, best of repeat runs.
+
+    Returns:
+        list: A (name, seconds) pair per command.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, command in STARTUP_COMMANDS:
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call([sys.executable] + command, cwd=here, stdout=subprocess.DEVNULL)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((name, best))
+    return results
+
+
+def format_startup(results):
+    """ Render the start up times as a table."""
+    lines = ['{0:<32} {1:>10}'.format('command', 'seconds')]
+    for name, seconds in results:
+        lines.append('{0:<32} {1:>10.3f}'.format(name, seconds))
+    return '\n'.join(lines)
+
+
+def main(args):
+    if args.startup:
+        print('')
+        print(format_startup(measure_startup(args.repeat)))
+        print('')
+        return
+
+    state = mock_array.MockArrayState(args.hosts, args.volumes, args.messages, args.latency,
+                                      args.error_rate, args.seed)
+    array = mock_array.MockFlashArray(state, pool_size=args.workers)
+
+    results = []
+    for name, func in benchmarks(array, state, args.workers):
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        results.append(measure(name, func, state, memory=not args.no_memory))
+
+    print('')
+    print('Mock array: {hosts} hosts, {volumes} volumes, {latency}s latency per call'.format(
+        hosts=args.hosts, volumes=args.volumes, latency=args.latency))
+    print(format_results(results))
+    print('')
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    # What the mock array looks like
+    parser.add_argument('--hosts', type=int, default=1000, help='Number of hosts on the mock array.')
+    parser.add_argument('--volumes', type=int, default=5000, help='Number of volumes on the mock array.')
+    parser.add_argument('--messages', type=int, default=50, help='Number of open messages on the mock array.')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds each REST call takes.')
+    parser.add_argument('--error_rate', type=float, default=0, help='Fraction of REST calls that fail with a 500.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the injected failures.')
+
+    # What to run
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Worker count for the concurrent helpers.')
+    parser.add_argument('--only', nargs='*', help='Only run benchmarks whose name contains one of these.')
+    parser.add_argument('--no_memory', action='store_true', help="Don't track peak memory, for more exact timings.")
+
+    # Command line start up time instead of the mock array benchmarks
+    parser.add_argument('--startup', action='store_true', help='Measure how long the command line tools take to start.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per command with --startup, the best is reported.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
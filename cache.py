@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import copy
+import json
+import os
+import threading
+import time
+
+# How long (in seconds) the results of each read call stay valid.
+DEFAULT_TTLS = {
+    'get': 60,
+    'get_phonehome': 600,
+    'list_hosts': 60,
+    'list_messages': 30,
+    'list_volumes': 60,
+    'list_volume_private_connections': 60,
+}
+
+# Maximum number of results we hold on to before evicting the least recently used.
+DEFAULT_MAX_SIZE = 256
+
+# The read calls whose cached results are out of date once a mutating call has run.
+INVALIDATES = {
+    'create_host': ('list_hosts',),
+    'delete_host': ('list_hosts', 'list_volume_private_connections'),
+    'connect_host': ('list_hosts', 'list_volume_private_connections'),
+    'disconnect_host': ('list_hosts', 'list_volume_private_connections'),
+    'create_volume': ('get', 'list_volumes'),
+    'destroy_volume': ('get', 'list_hosts', 'list_volumes', 'list_volume_private_connections'),
+    'eradicate_volume': ('get', 'list_volumes'),
+}
+
+
+class CachedFlashArray(object):
+    """ Wraps a FlashArray and caches the results of its read calls.
+
+    Results are kept per call and arguments for the TTL configured for that call, up to
+    max_size results in least recently used order. Calling any of the mutating methods
+    in INVALIDATES through the wrapper drops the cached results they affect, so the
+    helpers in hosts and volumes keep the cache correct when given a CachedFlashArray.
+    Everything else is passed straight through to the wrapped FlashArray.
+
+    If a path is given the cache is loaded from it, and save() writes it back so the
+    next run can skip pulling data that is still fresh. Use one file per array. The file is
+    plain JSON, only the x-next-token header of each result is kept so paging still works.
+    """
+
+    def __init__(self, array, ttls=None, max_size=DEFAULT_MAX_SIZE, path=None):
+        self._array = array
+        self._ttls = dict(DEFAULT_TTLS)
+        self._ttls.update(ttls or {})
+        self._max_size = max_size
+        self._path = path
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path) as cache_file:
+                self._entries.update(_load_entry(record) for record in json.load(cache_file))
+
+    def __getattr__(self, name):
+        attr = getattr(self._array, name)
+        if name in self._ttls:
+            return lambda *args, **kwargs: self._cached_call(name, attr, args, kwargs)
+        if name in INVALIDATES:
+            return lambda *args, **kwargs: self._mutating_call(name, attr, args, kwargs)
+        return attr
+
+    def _cached_call(self, name, method, args, kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(entry[1])
+
+        result = method(*args, **kwargs)
+
+        with self._lock:
+            self._entries[key] = (now + self._ttls[name], copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return result
+
+    def _mutating_call(self, name, method, args, kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            # Even a failed call may have changed something on the array.
+            self.invalidate(*INVALIDATES[name])
+
+    def invalidate(self, *names):
+        """ Drop cached results for the given read calls, or for everything if none are given."""
+        with self._lock:
+            if not names:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] in names]:
+                del self._entries[key]
+
+    def save(self):
+        """ Write the still valid cache entries to the path given at creation, if any."""
+        if not self._path:
+            return
+        now = time.time()
+        with self._lock:
+            records = [_dump_entry(key, entry) for key, entry in self._entries.items() if entry[0] > now]
+        with open(self._path, 'w') as cache_file:
+            json.dump(records, cache_file)
+
+
+# The response headers kept with cached results, paging needs the token for the next page.
+SAVED_HEADERS = ('x-next-token',)
+
+
+def _dump_entry(key, entry):
+    # A cache entry as a JSON record, with the headers of the result spelled out.
+    (name, args, kwargs), (expires, result) = key, entry
+    headers = getattr(result, 'headers', {})
+    return {'call': name, 'args': list(args), 'kwargs': [list(item) for item in kwargs],
+            'expires': expires, 'result': result,
+            'headers': dict((header, headers[header]) for header in SAVED_HEADERS if header in headers)}
+
+
+def _load_entry(record):
+    # Turn a record written by _dump_entry() back into a cache key and entry.
+    # Import the python rest-client in the python 3.x style
+    from purestorage import purestorage
+
+    result = record['result']
+    if isinstance(result, list):
+        result = purestorage.ResponseList(result)
+        result.headers = record['headers']
+    elif isinstance(result, dict):
+        result = purestorage.ResponseDict(result)
+        result.headers = record['headers']
+    key = (record['call'], tuple(record['args']), tuple(tuple(item) for item in record['kwargs']))
+    return key, (record['expires'], result)
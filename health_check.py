@@ -15,91 +15,141 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-# For demo purposes we just turn off the HTTPS warnings.
-# With real usage setting up the certificates for secure
-# requests is highly recommended.
-import requests.packages.urllib3
-requests.packages.urllib3.disable_warnings()
-
 import argparse
 import pprint
-
-# Import the python rest-client in the python 3.x style
-from purestorage import purestorage
+import time
+from concurrent import futures
 
 # Re-using our modules
 import array_info
+import cache
 import hosts
+import output
+import paging
+import profiling
+import rules
+import snapshots
 import volumes
 
 Gi = 1024 ** 3
 
+# Default number of REST calls we allow to be in flight at once while collecting.
+DEFAULT_WORKERS = 8
+
+# Default seconds a fleet check gives each REST call, and each array as a whole.
+DEFAULT_TIMEOUT = 60
+DEFAULT_ARRAY_TIMEOUT = 300
+
 def pformat_in_needed(obj, indent=4):
     """ Helper method to pformat things only if they pass a truthy check"""
     if obj:
         formatted_string = pprint.pformat(obj, indent)
-        indented_string = ''
-        for line in formatted_string.split('\n'):
-            indented_string = indented_string + '\n' + (' ' * indent * 2) + line
+        prefix = '\n' + (' ' * indent * 2)
+        indented_string = prefix + prefix.join(formatted_string.split('\n'))
         return "\n{}\n".format(indented_string)
 
 
-def main(args):
-    # The FlashArray object is the main entry point for the Python Rest Client. All interaction
-    # With the array is done through these objects.
-    array = purestorage.FlashArray(args.target, username=args.username, password=args.password)
+# Everything collect() knows how to fetch, each a function of the FlashArray. Volumes and
+# flagged messages are only counted, so we stream through them a page at a time.
+DATASETS = {
+    'basic_info': array_info.basic_info,
+    'space_info': array_info.space_info,
+    'total_allocated': lambda array: sum(vol['size'] for vol in volumes.iter_all(array, True)),
+    'phonehome_info': lambda array: array.get_phonehome(),
+    'open_messages': lambda array: array.list_messages(open=True),
+    'flagged_messages_count': lambda array: sum(1 for _ in paging.iter_pages(array.list_messages, flagged=True)),
+    'host_index': hosts.build_index,
+    'volume_stats': volumes.collect_stats,
+}
+
+# The datasets the report itself is made from, rules may ask for more.
+REPORT_DATASETS = ('basic_info', 'space_info', 'total_allocated', 'phonehome_info', 'open_messages',
+                   'flagged_messages_count', 'host_index')
+
+# The rules with their own place in REPORT_TEMPLATE, findings of any other rules are listed after it.
+REPORT_RULES = ('unused_hosts', 'disconnected_hosts', 'redundant_connection_hosts', 'non_redundant_connection_hosts',
+                'at_risk_vols')
+
+# Shown in place of the findings of a rule that was turned off for the run.
+NOT_CHECKED = 'not checked'
+
+
+def collect(array, workers=DEFAULT_WORKERS, datasets=None):
+    """ Gather everything the health report needs from the FlashArray.
+
+    None of these REST calls depend on each other, so they are issued in parallel
+    and the total time spent approaches that of the slowest single call.
+
+    Args:
+        array (FlashArray): The target FlashArray where we retrieve the information.
+        workers (int): The maximum number of REST calls to have in flight at once.
+        datasets (iterable): Names of the DATASETS to fetch on top of the REPORT_DATASETS.
+
+    Returns:
+        dict: The results keyed by dataset name.
+    """
+    names = set(REPORT_DATASETS).union(datasets or ())
+    with futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = dict((name, executor.submit(DATASETS[name], array)) for name in names)
+        return dict((name, future.result()) for name, future in pending.items())
+
 
+def analyze(data, checks=None, rule_workers=1):
+    """ Run the health check rules against data gathered by collect().
+
+    Args:
+        data (dict): The raw array information as returned by collect().
+        checks (list): The Rules to run as returned by rules.select(), the default ones with None.
+        rule_workers (int): Number of processes to evaluate the host rules with.
+
+    Returns:
+        dict: The values for the health report, keyed by the REPORT_TEMPLATE field names, plus
+              the findings of any rules enabled beyond those in the template. Fields of the
+              REPORT_RULES that weren't run are None, so they can't be mistaken for a clean result.
+    """
     # Some basic info...
-    basic_info = array_info.basic_info(array)
-    space_info = array_info.space_info(array)
+    basic_info = data['basic_info']
+    space_info = data['space_info']
     total_capacity = float(space_info["capacity"]) / Gi
     physical_used = float(space_info["total"]) / Gi
 
-    vols = volumes.list_all(array, True)
-    total_allocated = sum(item["size"] for item in vols) / Gi
-    
+    total_allocated = float(data['total_allocated']) / Gi
+
     # See if phone home is enabled
-    phonehome_info = array.get_phonehome()
+    phonehome_info = data['phonehome_info']
 
     # Lets check messages and alerts on the array next
-    open_messages = array.list_messages(open=True)
-    flagged_messages = array.list_messages(flagged=True)
-
-    # Lets look at the host connections and see if we have any that are not connected safetly
-    all_hosts = hosts.list_with_connections(array)
-
-    # Some categories we will look for
-    unused_hosts = []
-    disconnected_hosts = []
-    redundant_connection_hosts = []
-    non_redundant_connection_hosts = []
-    at_risk_vols = []
-
-    for host in all_hosts:
-        # target_ports is a list of the ports on the FlashArray the host is currently connected with
-        # vols is a list of the volumes connected to the host object in Puriy.
-        if not host['target_port']:
-            if not host['connections']:
-                unused_hosts.append(host)
-            else:
-                disconnected_hosts.append(host)
-
-        if host['target_port']:
-            # Make sure it has at least one connection to each controller.
-            ct0_connected = False
-            ct1_connected = False
-            for port in host['target_port']:
-                if 'CT0' in port:
-                    ct0_connected = True
-                if 'CT1' in port:
-                    ct1_connected = True
-
-            if not ct0_connected or not ct1_connected:
-                non_redundant_connection_hosts.append(host)
-                at_risk_vols = at_risk_vols + host['connections']
+    open_messages = data['open_messages']
+    flagged_messages_count = data['flagged_messages_count']
 
-    # Time to print out a report of all the info we've found
-    report_Summary = '''
+    # Lets look at the host connections and see if we have any that are not connected safetly,
+    # checks that are turned off for this run come back as None.
+    host_index = data['host_index']
+    findings = dict((name, None) for name in REPORT_RULES)
+    findings.update(rules.evaluate(data, rules.select() if checks is None else checks, rule_workers))
+    redundant_connection_hosts = findings.pop('redundant_connection_hosts')
+
+    report = dict(
+        array_name=basic_info['array_name'],
+        array_id=basic_info['id'],
+        purity_version=basic_info['version'],
+        total_capacity=total_capacity,
+        physical_used=physical_used,
+        total_allocated=total_allocated,
+        data_reduction=space_info['data_reduction'],
+        total_reduction=space_info['total_reduction'],
+        host_count=len(host_index.names),
+        redundant_connection_hosts_count=(None if redundant_connection_hosts is None
+                                          else len(redundant_connection_hosts)),
+        flagged_messages_count=flagged_messages_count,
+        open_messages=open_messages,
+        phonehome=phonehome_info['phonehome']
+    )
+    report.update(findings)
+    return report
+
+
+REPORT_TEMPLATE = '''
 *******************************************************************************
 **  Simple FlashArray Health Report
 ***********************************
@@ -129,33 +179,361 @@ Messages/Alerts:
 
 *******************************************************************************
 '''
-    print(report_Summary.format(
-        array_name=basic_info['array_name'],
-        array_id=basic_info['id'],
-        purity_version=basic_info['version'],
-        total_capacity=total_capacity,
-        physical_used=physical_used,
-        total_allocated=total_allocated,
-        data_reduction=space_info['data_reduction'],
-        total_reduction=space_info['total_reduction'],
-        host_count=len(all_hosts),
-        redundant_connection_hosts_count=len(redundant_connection_hosts),
-        unused_hosts=pformat_in_needed(unused_hosts),
-        disconnected_hosts=pformat_in_needed(disconnected_hosts),
-        non_redundant_connection_hosts=pformat_in_needed(non_redundant_connection_hosts),
-        at_risk_vols=pformat_in_needed(at_risk_vols),
-        flagged_messages_count=len(flagged_messages),
-        open_messages=pformat_in_needed(open_messages),
-        phonehome=phonehome_info['phonehome']
-    ))
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+TREND_TEMPLATE = '''Capacity Trend:
+    Growth (GB/day):        {growth_per_day}
+    Days until full:        {days_to_full}
+'''
+
+FLEET_SUMMARY_TEMPLATE = '''
+*******************************************************************************
+**  FlashArray Fleet Summary
+***********************************
+Arrays checked:     {checked_count}
+Arrays failed:      {failed_count}
+
+Current Usage (all arrays):
+    Total Capacity (GB):         {total_capacity}
+    Total Used (GB physical):  {physical_used}
+    Total Provisioned (GB):      {total_allocated}
+
+Hosts (all arrays):
+    Number of hosts:                        {host_count}
+    Hosts with non-redundant connections:   {non_redundant_connection_hosts_count}
+    Volumes connections at risk:            {at_risk_vols_count}
+    Flagged Message count:                  {flagged_messages_count}
+
+Failed Arrays:  {failures}
+*******************************************************************************
+'''
+
+def format_changes(changes):
+    """ Render the changes returned by snapshots.diff() as a short human readable report."""
+    lines = ['', 'Changes since the last run:']
+    for key, label in (('new_messages', 'New alerts'), ('cleared_messages', 'Cleared alerts'),
+                       ('new_hosts', 'New hosts'), ('removed_hosts', 'Removed hosts'),
+                       ('non_redundant_hosts', 'Hosts that became non-redundant'),
+                       ('redundant_hosts', 'Hosts that became redundant')):
+        if changes[key]:
+            lines.append('    {label}:{items}'.format(label=label, items=pformat_in_needed(changes[key])))
+    for key, (old, new) in sorted(changes['space'].items()):
+        lines.append('    {key}: {old} -> {new}'.format(key=key, old=old, new=new))
+    if len(lines) == 2:
+        lines.append('    None')
+    return '\n'.join(lines) + '\n'
+
+
+def format_report(report):
+    """ Render the values returned by analyze() as a human readable report."""
+    report = dict(report)
+    for key in ('unused_hosts', 'disconnected_hosts', 'non_redundant_connection_hosts',
+                'at_risk_vols', 'open_messages'):
+        report[key] = NOT_CHECKED if report[key] is None else pformat_in_needed(report[key])
+    if report['redundant_connection_hosts_count'] is None:
+        report['redundant_connection_hosts_count'] = NOT_CHECKED
+    text = REPORT_TEMPLATE.format(**report)
+
+    other_rules = [name for name in rules.RULES if name in report and name not in REPORT_RULES]
+    if other_rules:
+        text += '\nOther Checks:\n'
+        for name in other_rules:
+            text += '    {name}: {findings}\n'.format(name=name, findings=pformat_in_needed(report[name]) or 'OK')
+    return text
+
+
+def check_array(target, username, password, workers=DEFAULT_WORKERS, timeout=None, checks=None):
+    """ Connect to a single FlashArray, collect its data and run the health checks.
+
+    Args:
+        target (str): The FlashArray management IP or hostname.
+        username (str): Username for management access to the FlashArray.
+        password (str): Password for management access to the FlashArray.
+        workers (int): The maximum number of REST calls to have in flight at once.
+        timeout (float): Timeout in seconds applied to each REST call, or None to wait forever.
+        checks (list): The Rules to run as returned by rules.select(), the default ones with None.
+
+    Returns:
+        dict: The health report values as returned by analyze().
+    """
+    import sessions
+
+    request_kwargs = None if timeout is None else {'timeout': timeout}
+    array = sessions.get_array(target, username=username, password=password,
+                               request_kwargs=request_kwargs)
+    checks = rules.select() if checks is None else checks
+    data = collect(array, workers, rules.needs(checks))
+    with profiling.stage('health_check.analyze'):
+        return analyze(data, checks)
+
+
+def read_inventory(path, username=None, password=None):
+    """ Read the list of FlashArrays to check from an inventory file.
+
+    Each non-empty line holds a target, optionally followed by a username and password
+    for that array. Lines starting with '#' are ignored.
+
+    Args:
+        path (str): The path to the inventory file.
+        username (str): Username to use for targets that don't list their own.
+        password (str): Password to use for targets that don't list their own.
+
+    Returns:
+        list: A (target, username, password) tuple for each array in the inventory.
+    """
+    inventory = []
+    with open(path) as inventory_file:
+        for line in inventory_file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) == 1:
+                inventory.append((fields[0], username, password))
+            elif len(fields) == 3:
+                inventory.append(tuple(fields))
+            else:
+                raise ValueError('Invalid inventory line: {line}'.format(line=line.strip()))
+    return inventory
+
+
+def check_fleet(inventory, fleet_workers=DEFAULT_WORKERS, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+                checks=None, array_timeout=DEFAULT_ARRAY_TIMEOUT):
+    """ Run the health checks against many FlashArrays at once.
+
+    Arrays are checked through a bounded worker pool so a slow or unreachable array only
+    ties up its own worker. An array still running array_timeout seconds after its check
+    started is reported as failed without waiting for it, its worker is freed once its
+    current call hits the per call timeout.
+
+    Args:
+        inventory (list): (target, username, password) tuples, as returned by read_inventory().
+        fleet_workers (int): The maximum number of arrays to check at once.
+        workers (int): The maximum number of concurrent REST calls per array.
+        timeout (float): Timeout in seconds applied to each REST call, or None to wait forever.
+        checks (list): The Rules to run as returned by rules.select(), the default ones with None.
+        array_timeout (float): Seconds each array gets to finish its checks, or None to wait forever.
+
+    Returns:
+        tuple: A list of (target, report) pairs for the arrays that were checked, and a list
+               of (target, error) pairs for the ones that failed, both in inventory order.
+    """
+    started = dict()
+
+    def check(index, target, username, password):
+        started[index] = time.time()
+        return check_array(target, username, password, workers, timeout, checks)
+
+    results = dict()
+    executor = futures.ThreadPoolExecutor(max_workers=max(1, fleet_workers))
+    try:
+        pending = dict((executor.submit(check, index, *entry), index) for index, entry in enumerate(inventory))
+        while pending:
+            done, _ = futures.wait(pending, timeout=1 if array_timeout else None,
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    results[index] = (future.result(), None)
+                except Exception as err:
+                    results[index] = (None, str(err))
+
+            now = time.time()
+            for future, index in list(pending.items()):
+                if array_timeout and index in started and now - started[index] > array_timeout:
+                    del pending[future]
+                    results[index] = (None, 'No result after {0:g} seconds'.format(array_timeout))
+    finally:
+        # Arrays that ran out of time are left to finish in the background, nobody waits for them.
+        executor.shutdown(wait=False)
+
+    reports = [(target, results[index][0]) for index, (target, _, _) in enumerate(inventory)
+               if results[index][1] is None]
+    failures = [(target, results[index][1]) for index, (target, _, _) in enumerate(inventory)
+                if results[index][1] is not None]
+    return reports, failures
+
 
-    # Generic arguments to connect to the array
-    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
-    parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
-    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+def _fleet_count(reports, key):
+    # Total findings of a rule across the arrays it was checked on.
+    counts = [len(report[key]) for _, report in reports if report[key] is not None]
+    return sum(counts) if counts else NOT_CHECKED
 
+
+def format_fleet_summary(reports, failures):
+    """ Render a merged summary for the results returned by check_fleet()."""
+    return FLEET_SUMMARY_TEMPLATE.format(
+        checked_count=len(reports),
+        failed_count=len(failures),
+        total_capacity=sum(report['total_capacity'] for _, report in reports),
+        physical_used=sum(report['physical_used'] for _, report in reports),
+        total_allocated=sum(report['total_allocated'] for _, report in reports),
+        host_count=sum(report['host_count'] for _, report in reports),
+        non_redundant_connection_hosts_count=_fleet_count(reports, 'non_redundant_connection_hosts'),
+        at_risk_vols_count=_fleet_count(reports, 'at_risk_vols'),
+        flagged_messages_count=sum(report['flagged_messages_count'] for _, report in reports),
+        failures=pformat_in_needed(failures)
+    )
+
+
+def check_arguments(parser, args):
+    """ Check the parsed arguments hang together, exiting through parser.error() when they don't."""
+    if args.target and not (args.username and args.password):
+        parser.error('--username and --password are needed with --target')
+    if args.inventory:
+        try:
+            inventory = read_inventory(args.inventory, args.username, args.password)
+        except (IOError, ValueError) as err:
+            parser.error(str(err))
+        missing = [target for target, username, password in inventory if not (username and password)]
+        if missing:
+            parser.error('--username and --password are needed for arrays the inventory has no '
+                         'credentials for: {targets}'.format(targets=', '.join(missing)))
+    if args.offline:
+        # Inventory files only hold some of the datasets, rules needing others can't run offline.
+        import inventory as inventory_file
+        missing = rules.needs(rules.select(args.rules)) - set(inventory_file.DATASETS)
+        if missing:
+            parser.error('The selected --rules need data an --offline inventory does not have: '
+                         '{names}'.format(names=', '.join(sorted(missing))))
+
+
+def main(args):
+    checks = rules.select(args.rules)
+
+    if args.max_requests:
+        import resilience
+        resilience.set_concurrency_limit(args.max_requests)
+
+    if args.inventory:
+        inventory = read_inventory(args.inventory, args.username, args.password)
+        reports, failures = check_fleet(inventory, args.fleet_workers, args.workers, args.timeout, checks,
+                                        args.array_timeout)
+
+        if args.format != 'text':
+            # Every record gets an error column so failed arrays still show up in csv output.
+            records = [dict(target=target, error=None, **report) for target, report in reports]
+            records.extend(dict(target=target, error=error) for target, error in failures)
+            output.write_records(records, args.format)
+            return
+
+        # Time to print out a report of all the info we've found
+        for _, report in reports:
+            print(format_report(report))
+        print(format_fleet_summary(reports, failures))
+        return
+
+    if args.offline:
+        # Everything comes from an inventory file written by inventory.py, the array isn't touched.
+        import inventory as inventory_file
+        with inventory_file.Inventory(args.offline) as offline:
+            data = offline.collect(rules.needs(checks))
+    else:
+        # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+        # With the array is done through these objects, we get ours from the shared session cache.
+        import sessions
+        array = sessions.get_array(args.target, username=args.username, password=args.password)
+        if args.cache_file:
+            array = cache.CachedFlashArray(array, path=args.cache_file)
+
+        # Pull down everything we need up front, the calls are independent so they run concurrently.
+        data = collect(array, args.workers, rules.needs(checks))
+
+        if args.cache_file:
+            array.save()
+
+    if args.trend_store and not args.offline:
+        # Keep a capacity sample from every run, so the report can tell when the array fills up.
+        # An offline inventory only has the figures from when it was exported, those aren't
+        # recorded. Compacting the series each time keeps the store bounded when nothing else
+        # looks after it.
+        import trends
+        trends.append(args.trend_store, data['basic_info']['array_name'],
+                      [(None, data['space_info']['total'], data['space_info']['capacity'])])
+        trends.compact_series(args.trend_store, data['basic_info']['array_name'])
+
+    if args.state_file:
+        # Only report what changed since the last run, unless this is the first one.
+        previous = snapshots.load(args.state_file)
+        current = snapshots.take(data)
+        snapshots.save(args.state_file, current)
+        if previous is not None:
+            with profiling.stage('health_check.snapshots'):
+                changes = snapshots.diff(previous, current)
+            if args.format != 'text':
+                output.write_records([changes], args.format)
+            else:
+                print(format_changes(changes))
+            return
+
+    # Time to print out a report of all the info we've found
+    with profiling.stage('health_check.analyze'):
+        report = analyze(data, checks, args.rule_workers)
+    if args.trend_store:
+        import trends
+        trend = trends.growth(args.trend_store, report['array_name'], window=args.trend_days * trends.DAY)
+        # Offline checks don't record samples, so the store may not have any for this array.
+        report['growth_per_day'] = None if trend is None else trend['growth_per_day'] / Gi
+        report['days_to_full'] = None if trend is None else trend['days_to_full']
+    with profiling.stage('health_check.output'):
+        if args.format != 'text':
+            output.write_records([report], args.format)
+        else:
+            print(format_report(report))
+            if args.trend_store:
+                if report['growth_per_day'] is None:
+                    print(TREND_TEMPLATE.format(growth_per_day='no samples', days_to_full='unknown'))
+                else:
+                    print(TREND_TEMPLATE.format(
+                        growth_per_day=report['growth_per_day'],
+                        days_to_full='not growing' if report['days_to_full'] is None
+                        else int(report['days_to_full'])))
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    # Generic arguments to connect to the array, or arrays when given an inventory
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.')
+    targets.add_argument('--offline', help='Check an inventory file written by inventory.py instead of an array.')
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray')
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.')
+    parser.add_argument('--cache_file', help='File to cache read results in between runs against the same FlashArray.')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the report.')
+
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Maximum number of concurrent REST calls used while collecting data.')
+    parser.add_argument('--state_file', help='File to keep a snapshot of the array in. When it exists only the '
+                                             'changes since the last run are reported.')
+    parser.add_argument('--trend_store', help='Directory to record capacity samples in (see the trends module), '
+                                              'adds the growth rate and days until full to the report.')
+    parser.add_argument('--trend_days', type=float, default=30, help='Days of samples to fit the growth over.')
+
+    # Which checks to run and how
+    parser.add_argument('--rules', nargs='+', choices=list(rules.RULES), metavar='RULE',
+                        help='Only run these checks instead of the default ones. Available: ' +
+                             ', '.join('{name}{default}'.format(name=rule.name, default='' if rule.default else ' (off)')
+                                       for rule in rules.RULES.values()) + '.')
+    parser.add_argument('--rule_workers', type=int, default=1,
+                        help='Number of processes to evaluate the per host checks with, for very large arrays.')
+
+    # Fleet mode, check every array listed in an inventory file
+    targets.add_argument('-i', '--inventory', help='File listing the FlashArrays to check, one target '
+                                                  '(optionally followed by username and password) per line.')
+    parser.add_argument('--fleet_workers', type=int, default=DEFAULT_WORKERS,
+                        help='Maximum number of FlashArrays checked at once with --inventory.')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Timeout in seconds for each REST call with --inventory.')
+    parser.add_argument('--array_timeout', type=float, default=DEFAULT_ARRAY_TIMEOUT,
+                        help='Seconds each FlashArray gets to finish its checks with --inventory, '
+                             'arrays taking longer are reported as failed.')
+    parser.add_argument('--max_requests', type=int,
+                        help='Maximum number of REST calls in flight at once across all FlashArrays.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
-    main(args)
+    check_arguments(parser, args)
+    profiling.run(main, args)
@@ -15,20 +15,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-# For demo purposes we just turn off the HTTPS warnings.
-# With real usage setting up the certificates for secure
-# requests is highly recommended.
-import requests.packages.urllib3
-requests.packages.urllib3.disable_warnings()
-
 import argparse
+import collections
+import csv
+import json
 import pprint
 
-# Import the python rest-client in the python 3.x style
-from purestorage import purestorage
+# Optional read cache on top of the FlashArray sessions, which are only imported once we connect
+import cache
+
+# Helpers for running many host operations concurrently and paging through long lists
+import batch
+import paging
+
+# Machine readable output and profiling
+import output
+import profiling
 
 def create(array, name, iqnlist, wwnlist):
-    array.create_host(name, iqnlist=iqnlist, wwnlist=wwnlist)
+    return array.create_host(name, iqnlist=iqnlist, wwnlist=wwnlist)
 
 def delete(array, name):
     array.delete_host(name)
@@ -36,48 +41,194 @@ def delete(array, name):
 def connect_host_with_volume(array, host_name, volume_name):
     array.connect_host(host_name, volume_name)
 
-def list_with_connections(array):
+def is_redundant(controllers):
+    """ Whether a host logged in to these controllers (like 'CT0') has a connection to each of them."""
+    return 'CT0' in controllers and 'CT1' in controllers
+
+# One volume connection of a host, kept as a tuple to stay small when there are lots of them.
+# hgroup is set for connections the host gets through its host group rather than its own.
+Connection = collections.namedtuple('Connection', ['host', 'vol', 'lun', 'hgroup'])
+
+class HostIndex(object):
+    """ Hosts and their volume connections, indexed for quick lookups in either direction.
+
+    Attributes:
+        names (list): The host names, in the order the FlashArray listed them.
+        hosts (dict): Host name to the host as returned by list_hosts (never modified).
+        host_connections (dict): Host name to the list of its Connections.
+        vol_hosts (dict): Volume name to the list of hosts it is connected to.
+        host_ports (dict): Host name to the set of FlashArray target ports it is logged in to.
+        host_controllers (dict): Host name to the set of controllers (like 'CT0') it is logged in to.
+    """
+    __slots__ = ('names', 'hosts', 'host_connections', 'vol_hosts', 'host_ports', 'host_controllers')
+
+    def __init__(self, all_hosts, all_host_connections):
+        self.names = []
+        self.hosts = dict()
+        self.host_connections = dict()
+        self.vol_hosts = collections.defaultdict(list)
+        self.host_ports = dict()
+
+        for host in all_hosts:
+            hostname = host['name']
+            self.names.append(hostname)
+            self.hosts[hostname] = host
+            self.host_connections[hostname] = []
+            self.host_ports[hostname] = set()
+
+        # This list contains duplicate entries, one per volume connection,
+        # so we need to compress this info a little bit.
+        for row in all_host_connections:
+            hostname = row['name']
+            self.host_connections[hostname].append(Connection(hostname, row['vol'], row['lun'], row.get('hgroup')))
+            self.vol_hosts[row['vol']].append(hostname)
+            self.host_ports[hostname].update(row['target_port'] or ())
+
+        # Ports are named like 'CT0.ETH0', the part before the dot is the controller.
+        self.host_controllers = dict((hostname, frozenset(port.split('.')[0] for port in ports))
+                                     for hostname, ports in self.host_ports.items())
+
+    def connections(self, hostname):
+        """ The connections of a host as dicts with 'vol', 'lun' and 'host' keys."""
+        return [dict(conn._asdict()) for conn in self.host_connections[hostname]]
+
+    def host_dict(self, hostname):
+        """ A copy of the host with its 'connections' and 'target_port' filled in."""
+        host = dict(self.hosts[hostname])
+        host['connections'] = self.connections(hostname)
+        host['target_port'] = sorted(self.host_ports[hostname])
+        return host
+
+def build_index(array, page_size=paging.DEFAULT_PAGE_SIZE):
     # Start by getting the list of hosts.
-    all_hosts = array.list_hosts()
-
-    # This call only returns hosts with volume connections.
-    all_host_connections = array.list_hosts(all=True)
-
-    # This list contains duplicate entries, one per volume connection,
-    # so we need to compress this info a little bit.
-    hosts = dict()
-
-    for host in all_hosts:
-        hostname = host['name']
-        hosts[hostname] = host
-        hosts[hostname]['connections'] = []
-        hosts[hostname]['target_port'] = []
-
-    for host in all_host_connections:
-        hostname = host['name']
-        hosts[hostname]['connections'].append({
-            'vol': host['vol'],
-            'lun': host['lun'],
-            'host': host['name']
+    all_hosts = paging.iter_pages(array.list_hosts, page_size=page_size)
+
+    # This call only returns hosts with volume connections. We page through it so only
+    # the compact Connections are kept around, not every raw row at once.
+    all_host_connections = paging.iter_pages(array.list_hosts, page_size=page_size, all=True)
+
+    with profiling.stage('hosts.HostIndex'):
+        return HostIndex(all_hosts, all_host_connections)
+
+def list_with_connections(array):
+    index = build_index(array)
+    with profiling.stage('hosts.list_with_connections'):
+        return [index.host_dict(hostname) for hostname in index.names]
+
+def read_manifest(path):
+    """ Read the desired hosts and their volume connections from a manifest file.
+
+    JSON and YAML manifests hold a list of objects with a name and optional iqnlist, wwnlist
+    and volumes lists. CSV manifests have name, iqnlist, wwnlist and volumes columns where
+    the lists are space separated. YAML support needs PyYAML to be installed.
+
+    Returns:
+        list: A dict with name, iqnlist, wwnlist and volumes keys for each host.
+    """
+    with open(path) as manifest_file:
+        if path.endswith('.csv'):
+            entries = [dict((key, value.split() if key != 'name' else value)
+                            for key, value in row.items() if value)
+                       for row in csv.DictReader(manifest_file)]
+        elif path.endswith(('.yaml', '.yml')):
+            import yaml
+            entries = yaml.safe_load(manifest_file)
+        else:
+            entries = json.load(manifest_file)
+
+    manifest = []
+    for entry in entries:
+        manifest.append({
+            'name': entry['name'],
+            'iqnlist': _as_list(entry.get('iqnlist')),
+            'wwnlist': _as_list(entry.get('wwnlist')),
+            'volumes': _as_list(entry.get('volumes')),
         })
-        hosts[hostname]['target_port'] = host['target_port']
+    return manifest
+
+def _as_list(value):
+    # A single IQN, WWN or volume may be given on its own rather than as a list of one.
+    if isinstance(value, str):
+        return [value]
+    return list(value or [])
+
+def plan(array, manifest):
+    """ Work out what is missing on the FlashArray compared to the manifest.
+
+    Existing hosts are left as they are, we only create hosts that don't exist yet and
+    connect volumes that aren't already connected.
+
+    Returns:
+        tuple: The manifest entries for the hosts to create, and (host, volume) pairs to connect.
+    """
+    index = build_index(array)
+    existing = dict((hostname, set(conn.vol for conn in conns))
+                    for hostname, conns in index.host_connections.items())
+
+    creates = []
+    connects = []
+    for entry in manifest:
+        connected = existing.get(entry['name'])
+        if connected is None:
+            creates.append(entry)
+            connected = set()
+        for vol in entry['volumes']:
+            if vol not in connected:
+                connects.append((entry['name'], vol))
+    return creates, connects
 
-    return list(hosts.values())
+def apply(array, manifest, workers=batch.DEFAULT_WORKERS, rate=None):
+    """ Bring the FlashArray in line with the manifest, creating and connecting concurrently.
+
+    All the missing hosts are created first, then all the missing connections are made. We
+    don't try to connect volumes to a host we failed to create, those connections are recorded
+    as batch.Skipped.
+
+    Returns:
+        OrderedDict: Each operation, ('create', host) or ('connect', host, volume), mapped to None
+                     if it succeeded or the error it raised.
+    """
+    creates, connects = plan(array, manifest)
+
+    results = collections.OrderedDict()
+    entries = dict((entry['name'], entry) for entry in creates)
+    created = batch.run_all(lambda name: create(array, name, entries[name]['iqnlist'], entries[name]['wwnlist']),
+                            list(entries), workers, rate)
+    for name, error in created.items():
+        results[('create', name)] = error
+
+    connected = batch.run_all(lambda pair: connect_host_with_volume(array, pair[0], pair[1]),
+                              [pair for pair in connects if created.get(pair[0]) is None], workers, rate)
+    for name, vol in connects:
+        if (name, vol) in connected:
+            results[('connect', name, vol)] = connected[(name, vol)]
+        else:
+            results[('connect', name, vol)] = batch.Skipped('creating host {name} failed'.format(name=name))
+    return results
 
 def main(args):
     # The FlashArray object is the main entry point for the Python Rest Client. All interaction
-    # With the array is done through these objects.
-    array = purestorage.FlashArray(args.target, username=args.username, password=args.password)
+    # With the array is done through these objects, we get ours from the shared session cache.
+    import sessions
+    array = sessions.get_array(args.target, username=args.username, password=args.password)
+    if args.cache_file:
+        array = cache.CachedFlashArray(array, path=args.cache_file)
+
+    if args.action == 'list' and args.format != 'text':
+        index = build_index(array)
+        output.write_records((index.host_dict(host_name) for host_name in index.names), args.format)
+        if args.cache_file:
+            array.save()
+        return
 
     print('')
     if args.action == 'list':
-        hosts = list_with_connections(array)
+        index = build_index(array)
 
         # We will just iterate through the hosts and print their info.
-        for host in hosts:
-            host_name = host['name']
+        for host_name in index.names:
             print('Details for host "{name}"'.format(name=host_name))
-            pprint.pprint(host)
+            pprint.pprint(index.host_dict(host_name))
             print('')
     elif args.action == 'create':
         iqnlist = [] if args.iqnlist is None else args.iqnlist
@@ -97,25 +248,55 @@ def main(args):
         print('Connecting host {name} to volume {vol}...'.format(name=args.name, vol=args.vol_name))
         connect_host_with_volume(array, args.name, args.vol_name)
 
+    elif args.action == 'apply':
+        print('Creating hosts and connecting volumes from {manifest}...'.format(manifest=args.manifest))
+        results = apply(array, read_manifest(args.manifest), args.workers, args.rate)
+
+        failures = [(op, error) for op, error in results.items() if error is not None]
+        for op, error in failures:
+            print('{status} {action} {target}: {error}'.format(
+                status='Skipped' if isinstance(error, batch.Skipped) else 'Failed to', action=op[0],
+                target=' to '.join(op[1:]), error=error))
+        print('{succeeded} operations succeeded, {failed} failed or skipped.'.format(
+            succeeded=len(results) - len(failures), failed=len(failures)))
+
+    if args.cache_file:
+        array.save()
+
     print('Done!')
     print('')
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
     # Generic arguments to connect to the array
     parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
     parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
     parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+    parser.add_argument('--cache_file', help='File to cache read results in between runs against the same FlashArray.')
 
     # Add an action for what we want to do with hosts
-    parser.add_argument('action', help='The action to run', choices=['create', 'delete', 'list', 'connect'])
+    parser.add_argument('action', help='The action to run', choices=['create', 'delete', 'list', 'connect', 'apply'])
 
     # Some more specific options
     parser.add_argument('-n', '--name', help='Name of the host to be operated on or created.')
     parser.add_argument('-i', '--iqnlist', nargs='*', help='iSCSI IQN to associate with the host being created.')
     parser.add_argument('-w', '--wwnlist', nargs='*', help='FC WWN to associate with the host being created.')
     parser.add_argument('-v', '--vol_name', help='Name of the volume to attach to the host.')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the list action.')
+
+    # Options for the apply action
+    parser.add_argument('-m', '--manifest', help='CSV, JSON or YAML file describing the hosts and the volumes'
+                                                 ' connected to them. Required for apply.')
+    parser.add_argument('--workers', type=int, default=batch.DEFAULT_WORKERS,
+                        help='Maximum number of host operations to run at once.')
+    parser.add_argument('--rate', type=float, help='Maximum number of host operations to start per second.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
-    main(args)
+    profiling.run(main, args)
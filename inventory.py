@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import array as pyarray
+import itertools
+import json
+import mmap
+import os
+import struct
+import zlib
+
+# Re-using our modules
+import hosts
+import output
+import paging
+import profiling
+
+# Marks the start and the end of an inventory file.
+MAGIC = b'PUREINV1'
+
+# Rows per chunk. Every column of a chunk is compressed on its own, so the export only holds
+# one chunk in memory and the loader only decompresses the columns it is asked for.
+CHUNK_ROWS = 10000
+
+# Stands in for None in int columns.
+NO_INT = -2 ** 63
+
+# The columns kept for each table, and how each is encoded:
+#   int  - 64 bit integers
+#   str  - UTF-8 strings separated by NUL bytes, None is stored as an empty string
+#   json - a JSON list of the values, for lists like a host's WWNs
+TABLES = {
+    'hosts': [('name', 'str'), ('hgroup', 'str'), ('iqn', 'json'), ('wwn', 'json')],
+    'connections': [('name', 'str'), ('vol', 'str'), ('lun', 'int'), ('hgroup', 'str'), ('target_port', 'json')],
+    'volumes': [('name', 'str'), ('size', 'int'), ('source', 'str'), ('serial', 'str'), ('created', 'str')],
+}
+
+# The health_check datasets small enough to keep as they are, in the footer.
+SMALL_DATASETS = ('basic_info', 'space_info', 'phonehome_info', 'open_messages', 'flagged_messages_count')
+
+# Every health_check dataset Inventory.collect() can rebuild, the rest are worked out from the tables.
+DATASETS = SMALL_DATASETS + ('total_allocated', 'host_index')
+
+
+def _encode(kind, values):
+    if kind == 'int':
+        data = pyarray.array('q', (NO_INT if value is None else value for value in values)).tobytes()
+    elif kind == 'str':
+        data = '\0'.join(value or '' for value in values).encode('utf-8')
+    else:
+        data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(data)
+
+
+def _decode(kind, data, rows):
+    data = zlib.decompress(data)
+    if kind == 'int':
+        values = pyarray.array('q')
+        values.frombytes(data)
+        return values
+    if kind == 'str':
+        return [value or None for value in data.decode('utf-8').split('\0')] if rows else []
+    return json.loads(data.decode('utf-8'))
+
+
+def _write_table(inventory_file, columns, rows):
+    # Write the rows a chunk at a time, returning the chunk index for the footer.
+    chunks = []
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_ROWS))
+        if not chunk:
+            return chunks
+        offsets = dict()
+        for column, kind in columns:
+            data = _encode(kind, [row.get(column) for row in chunk])
+            offsets[column] = (inventory_file.tell(), len(data))
+            inventory_file.write(data)
+        chunks.append({'rows': len(chunk), 'columns': offsets})
+
+
+def export(array, path, page_size=paging.DEFAULT_PAGE_SIZE):
+    """ Stream the hosts, host connections and volumes of a FlashArray into an inventory file.
+
+    Each listing is paged through and written a chunk at a time, so memory use stays flat
+    however big the array is. The small health_check datasets (array info, space, phone home
+    and messages) go in the footer, so the file holds everything health_check needs.
+
+    Args:
+        array (FlashArray): The FlashArray to export.
+        path (str): The file to write, replaced once it is complete.
+        page_size (int): The number of objects to fetch per REST call.
+
+    Returns:
+        dict: The number of rows written per table.
+    """
+    # The health check knows how to fetch its datasets, we only pick the small ones.
+    import health_check
+
+    footer = {'datasets': dict((name, health_check.DATASETS[name](array)) for name in SMALL_DATASETS),
+              'tables': dict()}
+    listings = {
+        'hosts': paging.iter_pages(array.list_hosts, page_size=page_size),
+        'connections': paging.iter_pages(array.list_hosts, page_size=page_size, all=True),
+        'volumes': paging.iter_pages(array.list_volumes, page_size=page_size, pending=True),
+    }
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as inventory_file:
+        inventory_file.write(MAGIC)
+        for table, columns in TABLES.items():
+            with profiling.stage('inventory.export.' + table):
+                footer['tables'][table] = {'columns': columns,
+                                           'chunks': _write_table(inventory_file, columns, listings[table])}
+        data = zlib.compress(json.dumps(footer).encode('utf-8'))
+        inventory_file.write(data)
+        inventory_file.write(struct.pack('<Q', len(data)) + MAGIC)
+    os.rename(tmp_path, path)
+    return dict((table, sum(chunk['rows'] for chunk in info['chunks'])) for table, info in footer['tables'].items())
+
+
+class Inventory(object):
+    """ An inventory file written by export(), memory-mapped so only what is read gets loaded.
+
+    Use it as a context manager, or call close() when done.
+
+    Attributes:
+        datasets (dict): The small health_check datasets, by name.
+        tables (dict): Table name to its columns and chunk index.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if self._map[:len(MAGIC)] != MAGIC or self._map[size - len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError('{path} is not an inventory file'.format(path=path))
+        footer_size = struct.unpack('<Q', self._map[size - len(MAGIC) - 8:size - len(MAGIC)])[0]
+        footer_start = size - len(MAGIC) - 8 - footer_size
+        footer = json.loads(zlib.decompress(self._map[footer_start:footer_start + footer_size]).decode('utf-8'))
+        self.datasets = footer['datasets']
+        self.tables = footer['tables']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def count(self, table):
+        """ The number of rows in a table."""
+        return sum(chunk['rows'] for chunk in self.tables[table]['chunks'])
+
+    def column(self, table, column):
+        """ Iterate over the values of one column, a chunk at a time. Int columns come as typed arrays.
+
+        Yields:
+            The values of each chunk, in row order.
+        """
+        kinds = dict(self.tables[table]['columns'])
+        for chunk in self.tables[table]['chunks']:
+            offset, length = chunk['columns'][column]
+            yield _decode(kinds[column], self._map[offset:offset + length], chunk['rows'])
+
+    def rows(self, table, columns=None):
+        """ Iterate over the rows of a table as dicts, decompressing one chunk at a time.
+
+        Args:
+            table (str): One of the TABLES.
+            columns (list): Only decode these columns, all of them by default.
+        """
+        kinds = self.tables[table]['columns']
+        if columns is not None:
+            kinds = [(column, kind) for column, kind in kinds if column in columns]
+        for chunk in self.tables[table]['chunks']:
+            values = []
+            for column, kind in kinds:
+                offset, length = chunk['columns'][column]
+                decoded = _decode(kind, self._map[offset:offset + length], chunk['rows'])
+                if kind == 'int':
+                    decoded = [None if value == NO_INT else value for value in decoded]
+                values.append(decoded)
+            names = [column for column, _ in kinds]
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+    def collect(self, datasets=()):
+        """ Rebuild the data health_check.collect() returns from the inventory, for offline checks.
+
+        Args:
+            datasets (iterable): Names of extra datasets health check rules asked for.
+
+        Raises:
+            ValueError: If one of the datasets isn't in the inventory.
+
+        Returns:
+            dict: The results keyed by dataset name, like health_check.collect().
+        """
+        missing = set(datasets) - set(DATASETS)
+        if missing:
+            raise ValueError('Not in the inventory: {names}'.format(names=', '.join(sorted(missing))))
+
+        data = dict(self.datasets)
+        data['total_allocated'] = sum(sum(size for size in sizes if size != NO_INT)
+                                      for sizes in self.column('volumes', 'size'))
+        with profiling.stage('hosts.HostIndex'):
+            data['host_index'] = hosts.HostIndex(self.rows('hosts'), self.rows('connections'))
+        return data
+
+
+def main(args):
+    if args.action == 'export':
+        if not (args.target and args.username and args.password):
+            print('The export action needs --target, --username and --password')
+            return
+
+        # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+        # With the array is done through these objects, we get ours from the shared session cache.
+        import sessions
+        array = sessions.get_array(args.target, username=args.username, password=args.password)
+        counts = export(array, args.file)
+        print('Exported {hosts} hosts, {connections} connections and {volumes} volumes to {path} ({size} bytes)'.format(
+            path=args.file, size=os.path.getsize(args.file), **counts))
+        return
+
+    with Inventory(args.file) as inventory:
+        if args.action == 'info':
+            basic_info = inventory.datasets['basic_info']
+            print('Array {name} ({id}), Purity {version}'.format(name=basic_info['array_name'], id=basic_info['id'],
+                                                                 version=basic_info['version']))
+            for table in TABLES:
+                print('    {table:<12} {count} rows'.format(table=table, count=inventory.count(table)))
+        else:
+            output.write_records(inventory.rows(args.table), args.format)
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    parser.add_argument('action', choices=['export', 'info', 'show'],
+                        help='Export an array to a file, summarize a file, or print one of its tables.')
+    parser.add_argument('--file', required=True, help='The inventory file.')
+
+    # Arguments to connect to the array for the export action
+    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.')
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray')
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.')
+
+    parser.add_argument('--table', choices=sorted(TABLES), default='hosts', help='The table the show action prints.')
+    parser.add_argument('-f', '--format', choices=output.FORMATS, default='ndjson',
+                        help='Output format for the show action.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    profiling.run(main, args)
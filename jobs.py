@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent import futures
+
+# Re-using our modules
+import hosts
+import output
+import volumes
+
+# Default number of REST steps we run against one array at the same time.
+DEFAULT_CONCURRENCY = 8
+
+# Job states, a job is finished once it is succeeded or failed.
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+# The single REST steps jobs are made of, all called as func(array, *args). The disconnect,
+# destroy and eradicate steps of smarter_delete accept the same errors volumes.smarter_delete does.
+STEPS = dict(volumes.SMARTER_DELETE_STEPS, **{
+    'create_volume': volumes.create,
+    'destroy_volume': volumes.destroy,
+    'eradicate_volume': volumes.eradicate,
+    'create_host': hosts.create,
+    'delete_host': hosts.delete,
+    'connect': hosts.connect_host_with_volume,
+})
+
+# Errors meaning a step had already been done, only accepted for the step that was running
+# when the process stopped, since it may have gone through without us finding out.
+ALREADY_DONE = ('does not exist', 'has been destroyed', 'already exists', 'is not connected',
+                'already connected')
+
+
+def _as_list(value):
+    # IQNs and WWNs come from the command line and manifests as one comma separated string.
+    if isinstance(value, str):
+        return [item for item in value.split(',') if item]
+    return value
+
+
+# The operations jobs can be submitted for. Each works out its list of [step, *args] when the
+# job starts, that list is saved with the job so a restarted job picks up where it stopped.
+OPERATIONS = {
+    'create_volume': lambda array, vol_name, size: [['create_volume', vol_name, size]],
+    'destroy': lambda array, vol_name: [['destroy_volume', vol_name]],
+    'eradicate': lambda array, vol_name: [['eradicate_volume', vol_name]],
+    'smarter_delete': volumes.smarter_delete_steps,
+    'create_host': lambda array, name, iqnlist=None, wwnlist=None: [['create_host', name, _as_list(iqnlist),
+                                                                    _as_list(wwnlist)]],
+    'delete_host': lambda array, name: [['delete_host', name]],
+    'connect': lambda array, host_name, vol_name: [['connect', host_name, vol_name]],
+    'disconnect': lambda array, host_name, vol_name: [['disconnect', host_name, vol_name]],
+}
+
+
+class Job(object):
+    """ Handle on an operation submitted to a JobQueue.
+
+    Attributes:
+        id (str): Unique id of the job, use it to look the job up again after a restart.
+        target (str): The FlashArray the job runs against.
+        operation (str): One of the OPERATIONS.
+        args (list): Arguments for the operation.
+        state (str): PENDING, RUNNING, SUCCEEDED or FAILED.
+        steps (list): The [step, *args] lists the operation was broken into, None until planned.
+        done (int): How many of the steps have finished.
+        error (str): Why the job failed, if it did.
+        created (float): When the job was submitted.
+        finished (float): When the job succeeded or failed.
+    """
+    FIELDS = ('id', 'target', 'operation', 'args', 'state', 'steps', 'done', 'error', 'created', 'finished')
+
+    def __init__(self, id, target, operation, args, state=PENDING, steps=None, done=0, error=None,
+                 created=None, finished=None):
+        self.id = id
+        self.target = target
+        self.operation = operation
+        self.args = list(args)
+        self.state = state
+        self.steps = steps
+        self.done = done
+        self.error = error
+        self.created = time.time() if created is None else created
+        self.finished = finished
+        self._finished = asyncio.Event()
+        if self.state in (SUCCEEDED, FAILED):
+            self._finished.set()
+
+    def poll(self):
+        """ The current state of the job as a dict, without waiting."""
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    async def wait(self):
+        """ Wait for the job to finish and return its final state as a dict."""
+        await self._finished.wait()
+        return self.poll()
+
+
+class JobQueue(object):
+    """ Runs host and volume operations as asyncio jobs with bounded concurrency per array.
+
+    submit() saves the job and hands back a Job straight away, the steps then run in the
+    background with at most concurrency steps in flight per array. Every change of job state
+    is appended to a journal file, so after a restart resume() carries on with unfinished jobs
+    from the step they were on. The FlashArray client is blocking, so steps run on a thread
+    pool shared by all arrays while the event loop keeps track of hundreds of jobs.
+
+    Args:
+        get_array (callable): Called as get_array(target) from a worker thread to get the
+                              FlashArray of a target, like a wrapper around sessions.get_array.
+        journal (str): File to keep job state in, or None to keep it in memory only.
+        concurrency (int): The maximum number of steps in flight per array.
+        threads (int): Size of the thread pool running the steps, across all arrays.
+    """
+
+    def __init__(self, get_array, journal=None, concurrency=DEFAULT_CONCURRENCY, threads=32):
+        self._get_array = get_array
+        self._journal_path = journal
+        self._concurrency = concurrency
+        self._executor = futures.ThreadPoolExecutor(max_workers=threads)
+        self._arrays = dict()
+        self._limits = dict()
+        self._tasks = dict()
+        self.jobs = dict()
+        self._journal = None
+        if journal:
+            self._load()
+
+    def _load(self):
+        # Replay the journal, then write it back compacted to one line per job.
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash, whatever it said is lost.
+                        continue
+                    job = self.jobs.get(record['id'])
+                    if job is None:
+                        self.jobs[record['id']] = Job(**record)
+                    else:
+                        for field, value in record.items():
+                            setattr(job, field, value)
+            for job in self.jobs.values():
+                if job.state in (SUCCEEDED, FAILED):
+                    job._finished.set()
+
+        tmp_path = self._journal_path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            for job in self.jobs.values():
+                journal.write(json.dumps(job.poll()) + '\n')
+        os.rename(tmp_path, self._journal_path)
+        self._journal = open(self._journal_path, 'a')
+
+    def _save(self, job, *fields):
+        if self._journal is None:
+            return
+        record = dict((field, getattr(job, field)) for field in fields or Job.FIELDS)
+        record['id'] = job.id
+        self._journal.write(json.dumps(record) + '\n')
+        self._journal.flush()
+
+    async def _call(self, target, func, *args):
+        # Run one blocking REST step on the thread pool, within the array's concurrency limit.
+        loop = asyncio.get_running_loop()
+        if target not in self._limits:
+            self._limits[target] = asyncio.Semaphore(self._concurrency)
+        async with self._limits[target]:
+            array = self._arrays.get(target)
+            if array is None:
+                array = self._arrays[target] = await loop.run_in_executor(self._executor, self._get_array, target)
+            return await loop.run_in_executor(self._executor, func, array, *args)
+
+    async def _run(self, job):
+        # The step that was running when we last stopped may have gone through already.
+        resumed = job.state == RUNNING and job.steps is not None
+        job.state = RUNNING
+        self._save(job, 'state')
+        try:
+            if job.steps is None:
+                job.steps = await self._call(job.target, OPERATIONS[job.operation], *job.args)
+                self._save(job, 'steps')
+
+            while job.done < len(job.steps):
+                step = job.steps[job.done]
+                func = STEPS[step[0]]
+                if resumed:
+                    func = volumes.ignoring(func, *ALREADY_DONE)
+                await self._call(job.target, func, *step[1:])
+                resumed = False
+                job.done += 1
+                self._save(job, 'done')
+
+            job.state = SUCCEEDED
+        except Exception as err:
+            job.state = FAILED
+            job.error = str(err)
+        job.finished = time.time()
+        self._save(job, 'state', 'error', 'finished')
+        job._finished.set()
+
+    def _start(self, job):
+        self._tasks[job.id] = asyncio.ensure_future(self._run(job))
+        self._tasks[job.id].add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def submit(self, target, operation, *args):
+        """ Queue an operation against a FlashArray and return its Job straight away.
+
+        Args:
+            target (str): The FlashArray to run the operation against.
+            operation (str): One of the OPERATIONS, like 'smarter_delete'.
+            *args: Arguments for the operation, like the volume name.
+
+        Returns:
+            Job: Handle to poll() or wait() on.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError('Unknown operation: {operation}'.format(operation=operation))
+        job = Job(uuid.uuid4().hex, target, operation, args)
+        self.jobs[job.id] = job
+        self._save(job)
+        self._start(job)
+        return job
+
+    def resume(self):
+        """ Start every unfinished job loaded from the journal again.
+
+        Returns:
+            list: The resumed Jobs.
+        """
+        resumed = [job for job in self.jobs.values() if job.state in (PENDING, RUNNING) and job.id not in self._tasks]
+        for job in resumed:
+            self._start(job)
+        return resumed
+
+    async def wait_all(self):
+        """ Wait until every job that is running has finished."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()))
+
+    def close(self):
+        """ Shut down the thread pool and close the journal. Unfinished jobs stay in the journal."""
+        for task in self._tasks.values():
+            task.cancel()
+        self._executor.shutdown(wait=False)
+        if self._journal is not None:
+            self._journal.close()
+
+
+async def run(queue, target, operation, arg_lists):
+    """ Submit an operation once per argument list, wait for all of them and return the final states."""
+    submitted = [await queue.submit(target, operation, *args) for args in arg_lists]
+    return [await job.wait() for job in submitted]
+
+
+def main(args):
+    def get_array(target):
+        # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+        # With the array is done through these objects, we get ours from the shared session cache.
+        import sessions
+        return sessions.get_array(target, username=args.username, password=args.password)
+
+    if args.action != 'status' and not (args.username and args.password):
+        print('The {action} action needs --username and --password'.format(action=args.action))
+        return
+    if args.action == 'submit' and not (args.target and args.operation):
+        print('The submit action needs --target and an operation')
+        return
+
+    async def go():
+        queue = JobQueue(get_array, args.journal, args.concurrency)
+        try:
+            if args.action == 'status':
+                return [job.poll() for job in queue.jobs.values()]
+            if args.action == 'resume':
+                resumed = queue.resume()
+                print('Resuming {count} jobs...'.format(count=len(resumed)))
+                return [await job.wait() for job in resumed]
+
+            if args.manifest:
+                with open(args.manifest) as manifest_file:
+                    arg_lists = [line.split() for line in manifest_file if line.strip() and not line.startswith('#')]
+            else:
+                arg_lists = [args.args]
+            print('Running {count} {operation} jobs...'.format(count=len(arg_lists), operation=args.operation))
+            return await run(queue, args.target, args.operation, arg_lists)
+        finally:
+            queue.close()
+
+    results = asyncio.run(go())
+    if args.format != 'text':
+        output.write_records(results, args.format)
+        return
+    for job in results:
+        print('{id} {state:<9} {operation} {args} ({done}/{steps} steps){error}'.format(
+            id=job['id'], state=job['state'], operation=job['operation'], args=' '.join(map(str, job['args'])),
+            done=job['done'], steps=len(job['steps'] or ()) or '?',
+            error=': ' + job['error'] if job['error'] else ''))
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    parser.add_argument('action', choices=['submit', 'resume', 'status'],
+                        help='Run new jobs, carry on with unfinished ones from the journal, or list the journal.')
+    parser.add_argument('operation', nargs='?', choices=sorted(OPERATIONS), help='The operation to submit.')
+    parser.add_argument('args', nargs='*', help='Arguments for the operation, like a volume name. The IQNs and '
+                                                'WWNs of create_host are comma separated.')
+
+    # Generic arguments to connect to the array
+    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.')
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray')
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.')
+
+    parser.add_argument('-j', '--journal', default='jobs.journal', help='File to keep job state in.')
+    parser.add_argument('-m', '--manifest', help='File with the arguments of one job per line, to submit many.')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Maximum number of REST calls in flight per array.')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the job results.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
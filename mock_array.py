@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+import io
+import json
+import random
+import ssl
+import threading
+import time
+from http import server
+
+import requests
+import requests.adapters
+
+# Shared, pooled sessions to the FlashArrays, the mock plugs into these
+import sessions
+
+Gi = 1024 ** 3
+
+# The REST API version the mock array pretends to run.
+REST_VERSION = '1.16'
+
+# Multipliers of the size suffixes the REST API accepts, like '500M' or '1T'.
+SIZE_SUFFIXES = dict((suffix, 1024 ** power) for power, suffix in enumerate('KMGTP', 1))
+
+
+def _parse_size(size):
+    # Turn a size like 1073741824, '1073741824' or '1G' into bytes, None when it isn't valid.
+    text = str(size).strip().upper()
+    multiplier = SIZE_SUFFIXES.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    return int(text) * multiplier if text.isdigit() else None
+
+
+class MockArrayState(object):
+    """ The objects of a made up FlashArray and a handler for the REST calls the modules use.
+
+    Every volume is connected to one host, most hosts are logged in to both controllers but
+    some only to CT0 and a few to none, so the health checks have something to find.
+
+    Args:
+        hosts (int): Number of hosts to create.
+        volumes (int): Number of volumes to create.
+        messages (int): Number of open messages, every tenth of them flagged.
+        latency (float): Seconds every REST call takes before it is answered.
+        error_rate (float): Fraction of REST calls (other than logging in) that fail with a 500.
+        seed (int): Seed for the random errors, so runs can be repeated.
+    """
+
+    def __init__(self, hosts=100, volumes=500, messages=10, latency=0, error_rate=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.request_counts = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.hosts = collections.OrderedDict()
+        for i in range(hosts):
+            name = 'host-{0:05d}'.format(i)
+            self.hosts[name] = {'name': name, 'iqn': ['iqn.2016-01.com.example:{0}'.format(name)],
+                                'wwn': [], 'hgroup': None}
+
+        self.volumes = collections.OrderedDict()
+        self.destroyed = set()
+        for i in range(volumes):
+            name = 'vol-{0:06d}'.format(i)
+            self.volumes[name] = {'name': name, 'size': Gi * (1 + i % 10), 'source': None,
+                                  'serial': '{0:024X}'.format(i), 'created': '2016-01-01T00:00:00Z'}
+
+        # Connections indexed both ways, host -> {volume: lun} and volume -> {host: lun}
+        self.host_vols = dict((host, collections.OrderedDict()) for host in self.hosts)
+        self.vol_hosts = dict((vol, collections.OrderedDict()) for vol in self.volumes)
+        host_names = list(self.hosts)
+        for i, vol in enumerate(self.volumes):
+            if host_names:
+                self._connect(host_names[i % len(host_names)], vol, 1 + i // len(host_names))
+
+        # Full listings are built once and re-used for every page until something changes.
+        self._listings = dict()
+
+        self.messages = [{'id': i, 'code': 100 + i, 'category': 'hardware', 'current_severity': 'warning',
+                          'event': 'mock event {0}'.format(i), 'flagged': i % 10 == 0, 'opened': '2016-01-01T00:00:00Z'}
+                         for i in range(messages)]
+
+    @property
+    def request_count(self):
+        return sum(self.request_counts.values())
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts.clear()
+
+    def _target_ports(self, host):
+        number = int(host.split('-')[-1]) if host.split('-')[-1].isdigit() else 0
+        if number % 20 == 19:
+            return []
+        if number % 10 == 9:
+            return ['CT0.ETH0']
+        return ['CT0.ETH0', 'CT1.ETH0']
+
+    def _connect(self, host, vol, lun):
+        self.host_vols[host][vol] = lun
+        self.vol_hosts[vol][host] = lun
+
+    def _disconnect(self, host, vol):
+        del self.host_vols[host][vol]
+        del self.vol_hosts[vol][host]
+
+    def _listing(self, key, build):
+        if key not in self._listings:
+            self._listings[key] = build()
+        return self._listings[key]
+
+    def _page(self, items, body):
+        # Paging works off the offset into the list, which we hand out as the token.
+        start = int(body.get('token') or 0)
+        limit = body.get('limit')
+        if limit is None:
+            return items[start:], {}
+        end = start + limit
+        headers = {'x-next-token': str(end)} if end < len(items) else {}
+        return items[start:end], headers
+
+    def handle(self, method, path, body):
+        """ Answer one REST call.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The URL path, like '/api/1.16/volume'.
+            body (dict): The JSON decoded request body, which holds the call's arguments.
+
+        Returns:
+            tuple: The HTTP status code, the JSON response and a dict of extra headers.
+        """
+        parts = path.strip('/').split('/')[1:]
+        if parts and parts[0] != 'api_version':
+            parts = parts[1:]
+        resource = '/'.join(parts)
+
+        with self._lock:
+            self.request_counts[method + ' ' + (parts[0] if parts else '')] += 1
+            fail = parts[:1] not in (['api_version'], ['auth']) and self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 500, [{'msg': 'Injected failure.'}], {}
+
+        with self._lock:
+            try:
+                status, payload, headers = self._dispatch(method, parts, resource, body)
+            except KeyError as err:
+                return 400, [{'msg': '{0} does not exist.'.format(err.args[0])}], {}
+            if status == 200 and method != 'GET':
+                self._listings.clear()
+            return status, payload, headers
+
+    def _dispatch(self, method, parts, resource, body):
+        if resource == 'api_version':
+            return 200, {'version': [REST_VERSION]}, {}
+        if resource == 'auth/apitoken':
+            return 200, {'api_token': 'mock-api-token'}, {}
+        if resource == 'auth/session':
+            return 200, {'username': 'pureuser'}, {'Set-Cookie': 'session=mock-session; Path=/'}
+
+        if resource == 'array':
+            if body.get('space'):
+                total = sum(vol['size'] for vol in self.volumes.values()) // 5
+                return 200, {'capacity': 100 * 1024 * Gi, 'total': total, 'volumes': total,
+                             'data_reduction': 4.2, 'total_reduction': 9.7, 'thin_provisioning': 0.5}, {}
+            if body.get('phonehome'):
+                return 200, {'phonehome': 'enabled'}, {}
+            return 200, {'array_name': 'mock-array', 'id': 'mock-array-id', 'version': '4.10.0',
+                         'revision': 'mock'}, {}
+
+        if resource == 'message':
+            messages = [msg for msg in self.messages if not body.get('flagged') or msg['flagged']]
+            page, headers = self._page(messages, body)
+            return 200, page, headers
+
+        if parts[0] == 'volume':
+            return self._volume(method, parts, body)
+        if parts[0] == 'host':
+            return self._host(method, parts, body)
+        return 400, [{'msg': 'Unsupported call {0} {1}.'.format(method, resource)}], {}
+
+    def _volume_space(self, vol):
+        # Every volume uses a fifth of its size, so the array space adds up, but reduces differently.
+        size = vol['size'] or 0
+        data_reduction = 1 + int(vol['serial'], 16) * 13 % 80 / 10.0
+        return {'name': vol['name'], 'size': size, 'volumes': size // 5, 'snapshots': 0, 'total': size // 5,
+                'data_reduction': data_reduction, 'total_reduction': data_reduction * 2, 'thin_provisioning': 0.5,
+                'shared_space': None}
+
+    def _volume_performance(self, vol):
+        # Spread the load over the volumes by their serial, so top-N queries have something to find.
+        seed = int(vol['serial'], 16)
+        reads = seed * 37 % 1000
+        writes = seed * 53 % 800
+        return {'name': vol['name'], 'time': '2016-01-01T00:00:00Z', 'reads_per_sec': reads, 'writes_per_sec': writes,
+                'input_per_sec': writes * 8192, 'output_per_sec': reads * 8192,
+                'usec_per_read_op': 150 + seed * 7 % 900, 'usec_per_write_op': 200 + seed * 11 % 1200}
+
+    def _volume(self, method, parts, body):
+        if len(parts) == 1:
+            if body.get('space'):
+                view = self._volume_space
+            elif body.get('action') == 'monitor':
+                view = self._volume_performance
+            else:
+                view = None
+            # Live volumes, live and destroyed ones with pending, or only destroyed ones with pending_only.
+            if body.get('pending_only'):
+                listed = 'destroyed'
+            else:
+                listed = 'all' if body.get('pending') else 'live'
+            vols = self._listing(('volume', listed, view), lambda: [
+                view(vol) if view else vol for name, vol in self.volumes.items()
+                if listed == 'all' or (name in self.destroyed) == (listed == 'destroyed')])
+            page, headers = self._page(vols, body)
+            return 200, page, headers
+
+        name = parts[1]
+        if len(parts) == 3 and parts[2] == 'host':
+            # Looking up a missing object raises KeyError, which handle() turns into 'does not exist'.
+            return 200, [{'host': host, 'name': name, 'lun': lun}
+                         for host, lun in self.vol_hosts[name].items()], {}
+        if method == 'POST':
+            if name in self.volumes:
+                return 400, [{'msg': 'Volume already exists.'}], {}
+            size = _parse_size(body.get('size'))
+            if not size:
+                return 400, [{'msg': 'Invalid volume size.'}], {}
+            self.volumes[name] = {'name': name, 'size': size, 'source': None,
+                                  'serial': '{0:024X}'.format(len(self.volumes)), 'created': '2016-01-01T00:00:00Z'}
+            self.vol_hosts[name] = collections.OrderedDict()
+            return 200, self.volumes[name], {}
+        if method == 'DELETE':
+            self.volumes[name]
+            if body.get('eradicate'):
+                if name not in self.destroyed:
+                    return 400, [{'msg': 'Volume must be destroyed first.'}], {}
+                self.destroyed.discard(name)
+                del self.volumes[name]
+                del self.vol_hosts[name]
+            else:
+                if name in self.destroyed:
+                    return 400, [{'msg': 'Volume has been destroyed.'}], {}
+                if self.vol_hosts[name]:
+                    return 400, [{'msg': 'Volume has connected hosts.'}], {}
+                self.destroyed.add(name)
+            return 200, {'name': name}, {}
+        return 200, self.volumes[name], {}
+
+    def _host(self, method, parts, body):
+        if len(parts) == 1:
+            if body.get('all'):
+                rows = self._listing(('host', True), lambda: [
+                    {'name': host, 'vol': vol, 'lun': lun, 'hgroup': None, 'target_port': self._target_ports(host)}
+                    for host, vols in self.host_vols.items() for vol, lun in vols.items()])
+            else:
+                rows = self._listing(('host', False), lambda: list(self.hosts.values()))
+            page, headers = self._page(rows, body)
+            return 200, page, headers
+
+        name = parts[1]
+        if len(parts) == 4 and parts[2] == 'volume':
+            vol = parts[3]
+            connected = self.host_vols[name]
+            self.vol_hosts[vol]
+            if method == 'POST':
+                if vol in connected:
+                    return 400, [{'msg': 'Connection already exists.'}], {}
+                lun = 1 + len(connected)
+                self._connect(name, vol, lun)
+                return 200, {'name': name, 'vol': vol, 'lun': lun}, {}
+            if vol not in connected:
+                return 400, [{'msg': 'Host is not connected to volume.'}], {}
+            self._disconnect(name, vol)
+            return 200, {'name': name, 'vol': vol}, {}
+
+        if method == 'POST':
+            if name in self.hosts:
+                return 400, [{'msg': 'Host already exists.'}], {}
+            self.hosts[name] = {'name': name, 'iqn': body.get('iqnlist') or [], 'wwn': body.get('wwnlist') or [],
+                                'hgroup': None}
+            self.host_vols[name] = collections.OrderedDict()
+            return 200, self.hosts[name], {}
+        if method == 'DELETE':
+            for vol in list(self.host_vols[name]):
+                self._disconnect(name, vol)
+            del self.hosts[name]
+            del self.host_vols[name]
+            return 200, {'name': name}, {}
+        return 200, self.hosts[name], {}
+
+
+class MockAdapter(requests.adapters.BaseAdapter):
+    """ A requests transport adapter answering every request from a MockArrayState in process."""
+
+    def __init__(self, state):
+        super(MockAdapter, self).__init__()
+        self.state = state
+
+    def send(self, request, **kwargs):
+        body = json.loads(request.body or b'null') or {}
+        status, payload, headers = self.state.handle(request.method, requests.utils.urlparse(request.url).path, body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = server.BaseHTTPRequestHandler.responses.get(status, ('',))[0]
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.headers['Content-Type'] = 'application/json'
+        response.raw = io.BytesIO(json.dumps(payload).encode('utf-8'))
+        response.url = request.url
+        response.request = request
+        if 'Set-Cookie' in headers:
+            response.cookies.set('session', 'mock-session')
+        return response
+
+    def close(self):
+        pass
+
+
+class MockFlashArray(sessions.PooledFlashArray):
+    """ A FlashArray whose REST calls are answered in process by a MockArrayState.
+
+    The calls still go through the real client code, JSON encoding and decoding included,
+    only the network is skipped.
+    """
+
+    def __init__(self, state, **kwargs):
+        self._mock_state = state
+        super(MockFlashArray, self).__init__('mock-array', username='pureuser', password='pureuser', **kwargs)
+
+    def _make_session(self, pool_size):
+        session = requests.Session()
+        session.mount('https://', MockAdapter(self._mock_state))
+        return session
+
+
+def make_server(state, address='', port=8443, certfile=None, keyfile=None):
+    """ Create an HTTP server answering REST calls from the state, over HTTPS if a certfile is given.
+
+    The FlashArray client only talks HTTPS, so pointing the modules at the server needs a
+    certificate, for example one made with:
+        openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost -keyout key.pem -out cert.pem
+    """
+
+    class MockArrayHandler(server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'null') or {}
+            status, payload, headers = state.handle(self.command, self.path.split('?')[0], body)
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = server.ThreadingHTTPServer((address, port), MockArrayHandler)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+    return httpd
+
+
+def main(args):
+    state = MockArrayState(args.hosts, args.volumes, args.messages, args.latency, args.error_rate, args.seed)
+    httpd = make_server(state, args.address, args.port, args.certfile, args.keyfile)
+    print('Mock FlashArray with {hosts} hosts and {volumes} volumes listening on port {port}'.format(
+        hosts=args.hosts, volumes=args.volumes, port=args.port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    parser.add_argument('--address', default='', help='Address to listen on, all interfaces by default.')
+    parser.add_argument('--port', type=int, default=8443, help='Port to listen on.')
+    parser.add_argument('--certfile', help='TLS certificate to serve HTTPS with, needed by the FlashArray client.')
+    parser.add_argument('--keyfile', help='Private key for the TLS certificate, if not in the certfile.')
+
+    # What the mock array looks like
+    parser.add_argument('--hosts', type=int, default=100, help='Number of hosts on the mock array.')
+    parser.add_argument('--volumes', type=int, default=500, help='Number of volumes on the mock array.')
+    parser.add_argument('--messages', type=int, default=10, help='Number of open messages on the mock array.')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds each REST call takes.')
+    parser.add_argument('--error_rate', type=float, default=0, help='Fraction of REST calls that fail with a 500.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the injected failures.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
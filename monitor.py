@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import threading
+import time
+
+# Re-using our modules
+import array_info
+import hosts
+import paging
+import volumes
+
+# How often (in seconds) each data source is polled by default.
+DEFAULT_INTERVALS = {
+    'space': 60,
+    'hosts': 600,
+    'messages': 30,
+}
+
+# Name, help text and value key of each metric we serve.
+METRICS = [
+    ('purity_capacity_bytes', 'Total usable capacity of the array.', 'capacity'),
+    ('purity_used_bytes', 'Physical space used on the array.', 'used'),
+    ('purity_provisioned_bytes', 'Total provisioned size of all volumes.', 'provisioned'),
+    ('purity_data_reduction_ratio', 'Data reduction ratio of the array.', 'data_reduction'),
+    ('purity_total_reduction_ratio', 'Total reduction ratio of the array.', 'total_reduction'),
+    ('purity_hosts', 'Number of hosts on the array.', 'host_count'),
+    ('purity_non_redundant_hosts', 'Number of hosts not connected to both controllers.', 'non_redundant_hosts'),
+    ('purity_open_alerts', 'Number of open messages on the array.', 'open_alerts'),
+]
+
+
+class Monitor(object):
+    """ Polls a FlashArray in the background and keeps the latest health values in memory.
+
+    Each data source (space, hosts and messages) is refreshed by its own thread on its own
+    interval, all through the same FlashArray session. Reading the values never touches the
+    array.
+    """
+
+    def __init__(self, array, intervals=None):
+        self._array = array
+        self._intervals = dict(DEFAULT_INTERVALS)
+        self._intervals.update(intervals or {})
+        self._values = dict()
+        self._last_success = dict()
+        self._errors = dict((source, 0) for source in self._intervals)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _poll_space(self):
+        space = array_info.space_info(self._array)
+        provisioned = sum(vol['size'] for vol in volumes.iter_all(self._array, True))
+        return {
+            'capacity': space['capacity'],
+            'used': space['total'],
+            'provisioned': provisioned,
+            'data_reduction': space['data_reduction'],
+            'total_reduction': space['total_reduction'],
+        }
+
+    def _poll_hosts(self):
+        index = hosts.build_index(self._array)
+        controllers = index.host_controllers
+        non_redundant = sum(1 for hostname in index.names
+                            if controllers[hostname] and not hosts.is_redundant(controllers[hostname]))
+        return {
+            'host_count': len(index.names),
+            'non_redundant_hosts': non_redundant,
+        }
+
+    def _poll_messages(self):
+        return {'open_alerts': sum(1 for _ in paging.iter_pages(self._array.list_messages, open=True))}
+
+    def poll(self, source):
+        """ Refresh the values of one data source ('space', 'hosts' or 'messages') right now."""
+        values = getattr(self, '_poll_' + source)()
+        with self._lock:
+            self._values.update(values)
+            self._last_success[source] = time.time()
+
+    def _run(self, source):
+        while not self._stop.is_set():
+            try:
+                self.poll(source)
+            except Exception:
+                # Whatever went wrong (a REST error, a bad response, hosts changing between two
+                # listings) keep polling and serving the last values we had, the error count
+                # shows something is wrong.
+                with self._lock:
+                    self._errors[source] += 1
+            self._stop.wait(self._intervals[source])
+
+    def start(self):
+        """ Start polling every data source in the background."""
+        for source in self._intervals:
+            thread = threading.Thread(target=self._run, args=(source,), name='poll-' + source)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ Stop polling and wait for the polling threads to finish."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def metrics(self):
+        """ Render the current values in the Prometheus text exposition format."""
+        with self._lock:
+            values = dict(self._values)
+            last_success = dict(self._last_success)
+            errors = dict(self._errors)
+
+        lines = []
+        for name, help_text, key in METRICS:
+            if key in values:
+                lines.append('# HELP {name} {help}'.format(name=name, help=help_text))
+                lines.append('# TYPE {name} gauge'.format(name=name))
+                lines.append('{name} {value}'.format(name=name, value=float(values[key])))
+
+        lines.append('# HELP purity_last_poll_timestamp_seconds When each data source was last polled successfully.')
+        lines.append('# TYPE purity_last_poll_timestamp_seconds gauge')
+        for source, timestamp in sorted(last_success.items()):
+            lines.append('purity_last_poll_timestamp_seconds{{source="{source}"}} {value}'.format(
+                source=source, value=timestamp))
+
+        lines.append('# HELP purity_poll_errors_total Number of failed polls of each data source.')
+        lines.append('# TYPE purity_poll_errors_total counter')
+        for source, count in sorted(errors.items()):
+            lines.append('purity_poll_errors_total{{source="{source}"}} {value}'.format(source=source, value=count))
+        return '\n'.join(lines) + '\n'
+
+
+def make_server(monitor, address='127.0.0.1', port=9490):
+    """ Create an HTTP server answering GET /metrics from the monitor's in-memory values."""
+    from http import server
+
+    class MetricsHandler(server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = monitor.metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes come in all the time, don't fill the console with them.
+            pass
+
+    return server.ThreadingHTTPServer((address, port), MetricsHandler)
+
+
+def main(args):
+    # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+    # With the array is done through these objects, we get ours from the shared session cache.
+    import sessions
+    array = sessions.get_array(args.target, username=args.username, password=args.password)
+
+    monitor = Monitor(array, {
+        'space': args.space_interval,
+        'hosts': args.hosts_interval,
+        'messages': args.messages_interval,
+    })
+    monitor.start()
+
+    httpd = make_server(monitor, args.address, args.port)
+    print('Serving metrics for {target} on http://{address}:{port}/metrics'.format(
+        target=args.target, address=args.address or '0.0.0.0', port=args.port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        monitor.stop()
+        sessions.close_all()
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    # Generic arguments to connect to the array
+    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+
+    # Where to serve the metrics and how often to refresh them
+    parser.add_argument('--address', default='127.0.0.1',
+                        help='Address to serve metrics on, only this machine by default. The metrics are served '
+                             'without authentication, pass 0.0.0.0 to expose them on all interfaces.')
+    parser.add_argument('--port', type=int, default=9490, help='Port to serve metrics on.')
+    parser.add_argument('--space_interval', type=float, default=DEFAULT_INTERVALS['space'],
+                        help='Seconds between space and capacity polls.')
+    parser.add_argument('--hosts_interval', type=float, default=DEFAULT_INTERVALS['hosts'],
+                        help='Seconds between host connection polls.')
+    parser.add_argument('--messages_interval', type=float, default=DEFAULT_INTERVALS['messages'],
+                        help='Seconds between open message polls.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    main(args)
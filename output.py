@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import csv
+import io
+import json
+import sys
+
+# The machine readable formats the modules can print their results in, besides plain 'text'.
+FORMATS = ['json', 'ndjson', 'csv']
+
+
+def _csv_value(value):
+    # Lists and dicts don't fit in a cell, so they go in as JSON.
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def write_records(records, fmt, stream=None):
+    """ Serialize records (dicts) to the stream in one of the FORMATS.
+
+    json and csv output is built up in memory and written with a single call. ndjson is
+    written one line per record as they come, so it works well with generators.
+
+    Args:
+        records (iterable): The dicts to write.
+        fmt (str): One of FORMATS.
+        stream (file): Where to write the output, stdout by default.
+    """
+    stream = stream or sys.stdout
+
+    if fmt == 'ndjson':
+        for record in records:
+            stream.write(json.dumps(record) + '\n')
+        stream.flush()
+        return
+
+    if fmt == 'json':
+        stream.write(json.dumps(list(records)) + '\n')
+        return
+
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = None
+        for record in records:
+            if writer is None:
+                # The columns come from the first record, any extra keys later on are dropped.
+                writer = csv.DictWriter(buf, fieldnames=list(record), extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(dict((key, _csv_value(value)) for key, value in record.items()))
+        stream.write(buf.getvalue())
+        return
+
+    raise ValueError('Unknown output format: {fmt}'.format(fmt=fmt))
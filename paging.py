@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# Number of objects we ask the FlashArray for per request when paging through a list.
+DEFAULT_PAGE_SIZE = 1000
+
+
+def iter_pages(function, *args, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """ Iterate over the objects of a FlashArray list call one page at a time.
+
+    Only one page is held in memory at once and the first objects are available as soon
+    as the first page comes back. Paging needs REST API 1.7 or later.
+
+    Args:
+        function (callable): A FlashArray list method accepting limit and token, like array.list_volumes.
+        *args: Positional arguments for function.
+        page_size (int): The number of objects to request per call.
+        **kwargs: Keyword arguments for function.
+
+    Yields:
+        dict: Each object returned by the list call.
+    """
+    token = None
+    while True:
+        page_kwargs = dict(kwargs, limit=page_size)
+        if token:
+            page_kwargs['token'] = token
+        page = function(*args, **page_kwargs)
+        for item in page:
+            yield item
+
+        token = getattr(page, 'headers', {}).get('x-next-token')
+        if not page or not token:
+            return
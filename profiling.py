@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import collections
+import contextlib
+import json
+import sys
+import threading
+import time
+
+# Upper bounds (in seconds) of the latency histogram buckets, anything slower goes in the last one.
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Whether anything is being recorded. Check this before doing any work for the profiler,
+# so there is no cost beyond the check when profiling is off.
+enabled = False
+
+_lock = threading.Lock()
+_local = threading.local()
+_start = 0
+_calls = dict()
+_stages = dict()
+_retries = collections.Counter()
+_events = []
+
+
+class _Stats(object):
+    __slots__ = ('count', 'seconds', 'max_seconds', 'request_bytes', 'response_bytes', 'decode_seconds',
+                 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.decode_seconds = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def enable():
+    """ Start recording, dropping anything recorded before."""
+    global enabled, _start
+    with _lock:
+        _calls.clear()
+        _stages.clear()
+        _retries.clear()
+        del _events[:]
+        _start = time.time()
+    enabled = True
+
+
+def disable():
+    """ Stop recording, what was recorded so far is kept for summary() and write_trace()."""
+    global enabled
+    enabled = False
+
+
+def endpoint(method, path):
+    """ Name the REST endpoint of a call, with object names replaced so calls group together.
+
+    For example ('DELETE', 'host/h1/volume/v1') becomes 'DELETE host/:name/volume/:name'.
+    """
+    if path.startswith('http'):
+        # Calls made before the REST version is known use the full URL, like .../api/api_version
+        path = path.rsplit('/', 1)[-1]
+    parts = path.split('/')
+    if parts[0] in ('auth', 'array'):
+        # These are followed by fixed sub-resources (like auth/session), not object names.
+        return method + ' ' + path
+    return method + ' ' + '/'.join(':name' if i % 2 else part for i, part in enumerate(parts))
+
+
+def _event(name, category, start, seconds, args=None):
+    _events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': threading.current_thread().ident,
+                    'ts': (start - _start) * 1e6, 'dur': seconds * 1e6, 'args': args or {}})
+
+
+def record_call(method, path, start, seconds, request_bytes, response_bytes, decode_seconds, status):
+    """ Record one REST call made by the FlashArray client.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The REST API path, like 'volume/vol1'.
+        start (float): When the call was started, from time.time().
+        seconds (float): How long the HTTP round trip took.
+        request_bytes (int): Size of the request body.
+        response_bytes (int): Size of the response body.
+        decode_seconds (float): Time spent decoding the JSON response.
+        status (int): The HTTP status code.
+    """
+    name = endpoint(method, path)
+    _local.rest_seconds = getattr(_local, 'rest_seconds', 0.0) + seconds + decode_seconds
+    with _lock:
+        stats = _calls.get(name)
+        if stats is None:
+            stats = _calls[name] = _Stats()
+        stats.add(seconds)
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+        stats.decode_seconds += decode_seconds
+        _event(name, 'rest', start, seconds + decode_seconds, {'status': status, 'bytes': response_bytes})
+
+
+def record_retry(method, path, reason):
+    """ Record that a REST call had to be repeated, and why (like 'relogin' or 'http 503')."""
+    with _lock:
+        _retries[(endpoint(method, path), reason)] += 1
+
+
+class _NoStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_no_stage = _NoStage()
+
+
+@contextlib.contextmanager
+def _stage(name):
+    start = time.time()
+    rest_before = getattr(_local, 'rest_seconds', 0.0)
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        # Only count the time spent locally, REST calls made inside the stage are recorded on their own.
+        local_seconds = max(0.0, seconds - (getattr(_local, 'rest_seconds', 0.0) - rest_before))
+        with _lock:
+            stats = _stages.get(name)
+            if stats is None:
+                stats = _stages[name] = _Stats()
+            stats.add(local_seconds)
+            _event(name, 'local', start, seconds, {'local_seconds': local_seconds})
+
+
+def stage(name):
+    """ Context manager timing a piece of local processing, like building an index or a report.
+
+    Returns a shared do-nothing context manager when profiling is off.
+    """
+    if not enabled:
+        return _no_stage
+    return _stage(name)
+
+
+def summary():
+    """ Render what was recorded as a human readable summary."""
+    with _lock:
+        calls = sorted(_calls.items(), key=lambda item: -item[1].seconds)
+        stages = sorted(_stages.items(), key=lambda item: -item[1].seconds)
+        retries = sorted(_retries.items())
+
+    lines = ['', 'REST calls:',
+             '    {0:<40} {1:>6} {2:>10} {3:>10} {4:>10} {5:>12} {6:>10}'.format(
+                 'endpoint', 'calls', 'total s', 'avg ms', 'max ms', 'resp bytes', 'decode s')]
+    for name, stats in calls:
+        lines.append('    {0:<40} {1:>6} {2:>10.3f} {3:>10.1f} {4:>10.1f} {5:>12} {6:>10.3f}'.format(
+            name, stats.count, stats.seconds, stats.seconds / stats.count * 1000, stats.max_seconds * 1000,
+            stats.response_bytes, stats.decode_seconds))
+        buckets = ['<={0}ms:{1}'.format(bound * 1000, count)
+                   for bound, count in zip(BUCKETS, stats.histogram) if count]
+        if stats.histogram[-1]:
+            buckets.append('>{0}ms:{1}'.format(BUCKETS[-1] * 1000, stats.histogram[-1]))
+        lines.append('        ' + ' '.join(buckets))
+
+    lines.append('')
+    lines.append('Local processing:')
+    for name, stats in stages:
+        lines.append('    {0:<40} {1:>6} {2:>10.3f}'.format(name, stats.count, stats.seconds))
+
+    if retries:
+        lines.append('')
+        lines.append('Retries:')
+        for (name, reason), count in retries:
+            lines.append('    {0:<40} {1:<20} {2:>6}'.format(name, reason, count))
+    return '\n'.join(lines) + '\n'
+
+
+def run(main, args):
+    """ Call main(args), profiling it when args.profile or args.trace_file ask for it."""
+    if args.profile or args.trace_file:
+        enable()
+    try:
+        main(args)
+    finally:
+        if args.profile:
+            sys.stderr.write(summary())
+        if args.trace_file:
+            write_trace(args.trace_file)
+
+
+def write_trace(path):
+    """ Write every recorded call and stage as a Chrome trace (viewable in chrome://tracing or Perfetto)."""
+    with _lock:
+        events = list(_events)
+    with open(path, 'w') as trace_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
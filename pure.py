@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import importlib
+import sys
+
+# Subcommand name, the module implementing it and a one line description. Only the module of
+# the subcommand being run is imported, so "pure.py hosts --help" doesn't pay for the others.
+COMMANDS = [
+    ('array_info', 'array_info', 'Query for general array information and space usage.'),
+    ('hosts', 'hosts', 'Create, delete, list, and connect host objects.'),
+    ('volumes', 'volumes', 'Create, delete, and list volume objects.'),
+    ('health_check', 'health_check', 'Build a simple health report for one array or a fleet.'),
+    ('monitor', 'monitor', 'Serve array health as Prometheus metrics.'),
+    ('trends', 'trends', 'Record capacity samples and forecast when arrays and volumes fill up.'),
+    ('jobs', 'jobs', 'Run volume and host operations as resumable background jobs.'),
+    ('teardown', 'teardown', 'Plan and run the removal of whole sets of volumes and hosts.'),
+    ('inventory', 'inventory', 'Export hosts, connections and volumes to a compact file for offline checks.'),
+    ('mock_array', 'mock_array', 'Run a mock FlashArray to test against.'),
+    ('benchmark', 'benchmark', 'Benchmark the modules against the mock array.'),
+]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    commands = dict((name, module) for name, module, _ in COMMANDS)
+
+    parser = argparse.ArgumentParser(description='Python REST Client Demo',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='commands:\n' + '\n'.join(
+                                         '  {0:<14}{1}'.format(name, description)
+                                         for name, _, description in COMMANDS))
+    parser.add_argument('command', choices=sorted(commands), metavar='command',
+                        help='The command to run, see below. Run "pure.py <command> --help" for its arguments.')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv[:1])
+
+    # Now that we know which command was asked for we import it, and only it.
+    module = importlib.import_module(commands[args.command])
+    command_parser = argparse.ArgumentParser(prog='pure.py ' + args.command)
+    module.add_arguments(command_parser)
+    command_args = command_parser.parse_args(argv[1:])
+    # Checks that span several arguments, which argparse can't express, are up to the module.
+    if hasattr(module, 'check_arguments'):
+        module.check_arguments(command_parser, command_args)
+
+    if hasattr(command_args, 'profile'):
+        import profiling
+        profiling.run(module.main, command_args)
+    else:
+        module.main(command_args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import threading
+import time
+
+# Import the python rest-client in the python 3.x style
+from purestorage import purestorage
+
+
+class RetryPolicy(object):
+    """ Decides which failed REST calls are tried again and how long to wait in between.
+
+    Only calls that are safe to repeat are retried: the methods in safe_methods (reads by
+    default) and logging in. Creating, destroying or connecting things is never repeated,
+    since the first attempt may have gone through even though we didn't get an answer.
+
+    Args:
+        retries (int): How many times to retry a call after the first attempt.
+        base_delay (float): Seconds to wait before the first retry, doubled for each retry after.
+        max_delay (float): The longest we ever wait between attempts.
+        retry_statuses (tuple): HTTP status codes worth trying again.
+        safe_methods (tuple): HTTP methods that can be repeated without side effects.
+    """
+
+    def __init__(self, retries=3, base_delay=0.5, max_delay=10, retry_statuses=(429, 500, 502, 503, 504),
+                 safe_methods=('GET',)):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.safe_methods = safe_methods
+
+    def can_retry(self, method, path, attempt):
+        """ Whether a call that failed on the given attempt (counting from 0) may be tried again."""
+        safe = method in self.safe_methods or path.startswith('auth/') or path.startswith('http')
+        return safe and attempt < self.retries
+
+    def delay(self, attempt, retry_after=None):
+        """ Seconds to wait before the next attempt, exponential backoff with full jitter.
+
+        A Retry-After value sent by the array is used as the minimum wait.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.max_delay, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+
+class CircuitBreaker(object):
+    """ Stops calling an array that keeps failing, so we don't pile more load onto it.
+
+    After threshold failures in a row the circuit opens and calls fail straight away with a
+    PureError. Once cooldown seconds have passed one call is let through, if it works the
+    circuit closes again, otherwise it stays open for another cooldown.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self, target):
+        """ Raise a PureError if the circuit is open and calls to the target should not be made."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if not self._trial and time.time() - self._opened_at >= self.cooldown:
+                # Let this one call through to see if the array has recovered.
+                self._trial = True
+                return
+        raise purestorage.PureError('Circuit open for {target} after repeated failures'.format(target=target))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.time()
+                self._trial = False
+
+
+class _NoLimit(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+# Limits the number of REST calls in flight across every array, set with set_concurrency_limit().
+limiter = _NoLimit()
+
+
+def set_concurrency_limit(limit):
+    """ Allow at most limit REST calls in flight at once across every array, or any number with None."""
+    global limiter
+    limiter = threading.BoundedSemaphore(limit) if limit else _NoLimit()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import multiprocessing
+from concurrent import futures
+
+import hosts
+import profiling
+
+
+class Rule(object):
+    """ A registered health check.
+
+    Attributes:
+        name (str): Name of the rule, also the report field its findings go in.
+        func (callable): The check itself, see register() for how it is called.
+        needs (tuple): Names of the health_check datasets the rule reads.
+        scope (str): 'host' for rules run once per host, 'array' for rules run once per array.
+        default (bool): Whether the rule runs when no rules are picked explicitly.
+        description (str): One line saying what the rule looks for.
+    """
+    __slots__ = ('name', 'func', 'needs', 'scope', 'default', 'description')
+
+    def __init__(self, name, func, needs, scope, default, description):
+        self.name = name
+        self.func = func
+        self.needs = tuple(needs)
+        self.scope = scope
+        self.default = default
+        self.description = description
+
+
+# Every registered rule by name, in the order they were registered.
+RULES = collections.OrderedDict()
+
+
+def register(name, needs=('host_index',), scope='host', default=True, description=None):
+    """ Decorator registering a function as a health check rule.
+
+    Host rules are called as func(data, hostname) for every host, array rules as func(data)
+    once. Either way data is what health_check.collect() returned and the rule returns a list
+    of findings, empty when all is well. The findings of all hosts are joined in host order.
+
+    Args:
+        name (str): Name of the rule and the report field its findings go in.
+        needs (tuple): Names of the health_check datasets the rule reads.
+        scope (str): 'host' or 'array'.
+        default (bool): Whether the rule runs when no rules are picked explicitly.
+        description (str): What the rule looks for, the docstring of func by default.
+    """
+    def decorator(func):
+        RULES[name] = Rule(name, func, needs, scope, default,
+                           description or (func.__doc__ or '').strip().split('\n')[0])
+        return func
+    return decorator
+
+
+def select(names=None):
+    """ Look up the rules to run, the given names or every rule enabled by default.
+
+    Raises:
+        KeyError: If one of the names isn't a registered rule.
+    """
+    if names is None:
+        return [rule for rule in RULES.values() if rule.default]
+    return [RULES[name] for name in names]
+
+
+def needs(rules):
+    """ The set of datasets the given rules read between them."""
+    return set(dataset for rule in rules for dataset in rule.needs)
+
+
+def _run_hosts(rule_names, data, hostnames):
+    # One pass over the hosts, running every host rule on each before moving to the next.
+    host_rules = [RULES[name] for name in rule_names]
+    results = dict((rule.name, []) for rule in host_rules)
+    for hostname in hostnames:
+        for rule in host_rules:
+            findings = rule.func(data, hostname)
+            if findings:
+                results[rule.name].extend(findings)
+    return results
+
+
+# The data the worker processes evaluate against, set when they start.
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_hosts_in_worker(rule_names, hostnames):
+    return _run_hosts(rule_names, _worker_data, hostnames)
+
+
+def evaluate(data, rules, workers=1):
+    """ Run health check rules against data gathered by health_check.collect().
+
+    Array rules run once each. Host rules share a single pass over the hosts, which with
+    more than one worker is split into chunks evaluated by a pool of forked processes, so
+    large arrays and long rule lists use every CPU. The workers inherit data when they
+    are forked rather than having it sent to them, only their findings are sent back.
+
+    Args:
+        data (dict): The array information as returned by health_check.collect().
+        rules (list): The Rules to run, as returned by select().
+        workers (int): Number of processes to split the host rules over, 1 to run them here.
+
+    Returns:
+        dict: The findings of each rule keyed by rule name.
+    """
+    results = dict()
+    with profiling.stage('rules.array'):
+        for rule in rules:
+            if rule.scope == 'array':
+                results[rule.name] = rule.func(data)
+
+    host_rules = [rule.name for rule in rules if rule.scope == 'host']
+    if not host_rules:
+        return results
+
+    hostnames = data['host_index'].names
+    # Forking is what makes handing data to the workers cheap, without it we stay in process.
+    if workers <= 1 or len(hostnames) < workers or 'fork' not in multiprocessing.get_all_start_methods():
+        with profiling.stage('rules.hosts'):
+            results.update(_run_hosts(host_rules, data, hostnames))
+        return results
+
+    chunk_size = -(-len(hostnames) // (workers * 4))
+    chunks = [hostnames[i:i + chunk_size] for i in range(0, len(hostnames), chunk_size)]
+    with futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_worker, initargs=(data,)) as executor:
+        for name in host_rules:
+            results[name] = []
+        # map() hands the chunk results back in order, so findings stay in host order.
+        for chunk_results in executor.map(_run_hosts_in_worker, [host_rules] * len(chunks), chunks):
+            for name, findings in chunk_results.items():
+                results[name].extend(findings)
+    return results
+
+
+# The built in rules. host_ports are the ports on the FlashArray a host is currently logged
+# in to, host_connections are the volumes connected to the host object in Purity.
+
+@register('unused_hosts')
+def unused_hosts(data, hostname):
+    """ Hosts that are not logged in to the array and have no volumes."""
+    host_index = data['host_index']
+    if not host_index.host_ports[hostname] and not host_index.host_connections[hostname]:
+        return [host_index.host_dict(hostname)]
+
+
+@register('disconnected_hosts')
+def disconnected_hosts(data, hostname):
+    """ Hosts with volumes that are not logged in to the array."""
+    host_index = data['host_index']
+    if not host_index.host_ports[hostname] and host_index.host_connections[hostname]:
+        return [host_index.host_dict(hostname)]
+
+
+@register('redundant_connection_hosts')
+def redundant_connection_hosts(data, hostname):
+    """ Hosts logged in to both controllers."""
+    host_index = data['host_index']
+    if host_index.host_ports[hostname] and hosts.is_redundant(host_index.host_controllers[hostname]):
+        return [hostname]
+
+
+@register('non_redundant_connection_hosts')
+def non_redundant_connection_hosts(data, hostname):
+    """ Hosts logged in to only one of the controllers."""
+    host_index = data['host_index']
+    if host_index.host_ports[hostname] and not hosts.is_redundant(host_index.host_controllers[hostname]):
+        return [host_index.host_dict(hostname)]
+
+
+@register('at_risk_vols')
+def at_risk_vols(data, hostname):
+    """ Volume connections of hosts logged in to only one of the controllers."""
+    host_index = data['host_index']
+    if host_index.host_ports[hostname] and not hosts.is_redundant(host_index.host_controllers[hostname]):
+        return host_index.connections(hostname)
+
+
+@register('nearly_full', needs=('space_info',), scope='array', default=False)
+def nearly_full(data):
+    """ The array is more than 80% full."""
+    space_info = data['space_info']
+    if space_info['capacity'] and space_info['total'] > 0.8 * space_info['capacity']:
+        return ['{0:.0%} of capacity used'.format(float(space_info['total']) / space_info['capacity'])]
+    return []
+
+
+@register('poorly_reducing_vols', needs=('volume_stats',), scope='array', default=False)
+def poorly_reducing_vols(data):
+    """ Volumes using over 1 GB that reduce less than 1.5 to 1."""
+    stats = data['volume_stats']
+    used = stats.columns['total']
+    reduction = stats.columns['data_reduction']
+    return [stats.names[i] for i in range(len(stats)) if used[i] > 1024 ** 3 and reduction[i] < 1.5]
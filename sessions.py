@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import json
+import threading
+import time
+
+# For demo purposes we just turn off the HTTPS warnings.
+# With real usage setting up the certificates for secure
+# requests is highly recommended.
+import requests
+import requests.adapters
+import requests.packages.urllib3
+requests.packages.urllib3.disable_warnings()
+
+# Import the python rest-client in the python 3.x style
+from purestorage import purestorage
+
+# Per call timings, only recorded when profiling is enabled
+import profiling
+
+# Retries, backoff and circuit breaking around every REST call
+import resilience
+
+# Number of keep-alive connections each session keeps open to its array. This should be
+# at least as large as the number of REST calls we make concurrently against one array.
+DEFAULT_POOL_SIZE = 8
+
+# Authenticated FlashArray objects keyed on target and credentials, and the API tokens we
+# have obtained for them so a new session never needs to log in with a password again.
+_sessions = dict()
+_api_tokens = dict()
+_lock = threading.Lock()
+
+
+def _key(target, username, secret):
+    # The password or API token is part of the key, so a session is only handed to callers who
+    # could have logged in themselves. Only a digest of it is kept.
+    return target, username, hashlib.sha256((secret or '').encode('utf-8')).hexdigest()
+
+
+class PooledFlashArray(purestorage.FlashArray):
+    """ A FlashArray that keeps its HTTPS connections open between REST calls.
+
+    The stock client opens a new connection for every request, this one sends them all
+    through a single requests.Session. If the API token stops being accepted (for example
+    it was recreated on the array) and we know the username and password, we log in again
+    and carry on instead of failing.
+
+    Calls that fail with a connection error or a busy status are retried according to the
+    retry_policy, and a per array circuit_breaker stops us from hammering an array that
+    keeps failing. Both default to the settings in the resilience module.
+    """
+
+    def __init__(self, target, username=None, password=None, api_token=None,
+                 pool_size=DEFAULT_POOL_SIZE, retry_policy=None, circuit_breaker=None, **kwargs):
+        self._retry_policy = retry_policy or resilience.RetryPolicy()
+        self._circuit_breaker = circuit_breaker or resilience.CircuitBreaker()
+        self._username = username
+        self._password = password
+        self._session = self._make_session(pool_size)
+        if api_token:
+            # The client doesn't allow passing both, the credentials are only kept for re-login.
+            username = password = None
+        super(PooledFlashArray, self).__init__(target, username=username, password=password,
+                                               api_token=api_token, **kwargs)
+
+    def _make_session(self, pool_size):
+        """ Create the requests.Session every REST call goes through."""
+        session = requests.Session()
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return session
+
+    def _request(self, method, path, data=None, reestablish_session=True):
+        """ Perform HTTP request for REST API, the same as FlashArray but on our session."""
+        if path.startswith("http"):
+            url = path
+        else:
+            url = self._format_path(path)
+
+        headers = {"Content-Type": "application/json"}
+        if self._user_agent:
+            headers['User-Agent'] = self._user_agent
+
+        body = json.dumps(data).encode("utf-8")
+        if profiling.enabled:
+            start = time.time()
+        response = self._send(method, path, url, body, headers)
+        if profiling.enabled:
+            seconds = time.time() - start
+
+        if response.status_code == 200:
+            if "application/json" in response.headers.get("Content-Type", ""):
+                if response.cookies:
+                    self._cookies.update(response.cookies)
+                else:
+                    self._cookies.clear()
+                if profiling.enabled:
+                    decode_start = time.time()
+                    content = response.json()
+                    profiling.record_call(method, path, start, seconds, len(body), len(response.content),
+                                          time.time() - decode_start, response.status_code)
+                else:
+                    content = response.json()
+                if isinstance(content, list):
+                    content = purestorage.ResponseList(content)
+                elif isinstance(content, dict):
+                    content = purestorage.ResponseDict(content)
+                content.headers = response.headers
+                return content
+            raise purestorage.PureError("Response not in JSON: " + response.text)
+
+        if profiling.enabled:
+            profiling.record_call(method, path, start, seconds, len(body), len(response.content), 0.0,
+                                  response.status_code)
+        if response.status_code == 401 and reestablish_session:
+            if profiling.enabled:
+                profiling.record_retry(method, path, 'relogin')
+            self._start_session()
+            return self._request(method, path, data, False)
+        elif response.status_code == 450 and self._renegotiate_rest_version:
+            if profiling.enabled:
+                profiling.record_retry(method, path, 'rest version')
+            # Purity REST API version is incompatible.
+            old_version = self._rest_version
+            self._rest_version = self._choose_rest_version()
+            if old_version == self._rest_version:
+                raise purestorage.PureHTTPError(self._target, str(self._rest_version), response)
+            return self._request(method, path, data, reestablish_session)
+        else:
+            raise purestorage.PureHTTPError(self._target, str(self._rest_version), response)
+
+    def _send(self, method, path, url, body, headers):
+        """ Send one HTTP request, retrying it if it fails and the retry policy allows."""
+        attempt = 0
+        while True:
+            self._circuit_breaker.before_call(self._target)
+            retry_after = None
+            try:
+                with resilience.limiter:
+                    response = self._session.request(method, url, data=body, headers=headers,
+                                                     cookies=self._cookies, **self._request_kwargs)
+            except requests.exceptions.RequestException as err:
+                self._circuit_breaker.record_failure()
+                if not self._retry_policy.can_retry(method, path, attempt):
+                    raise purestorage.PureError(err)
+                reason = type(err).__name__
+            else:
+                if response.status_code not in self._retry_policy.retry_statuses:
+                    self._circuit_breaker.record_success()
+                    return response
+                self._circuit_breaker.record_failure()
+                if not self._retry_policy.can_retry(method, path, attempt):
+                    return response
+                reason = 'http {0}'.format(response.status_code)
+                retry_after = response.headers.get('Retry-After')
+
+            if profiling.enabled:
+                profiling.record_retry(method, path, reason)
+            time.sleep(self._retry_policy.delay(attempt, retry_after))
+            attempt += 1
+
+    def _start_session(self):
+        """ Start a REST API session, logging in again if our API token is no longer valid."""
+        try:
+            super(PooledFlashArray, self)._start_session()
+        except purestorage.PureHTTPError as err:
+            if err.code not in (400, 401) or not (self._username and self._password):
+                raise
+            self._api_token = self._obtain_api_token(self._username, self._password)
+            with _lock:
+                _api_tokens[_key(self._target, self._username, self._password)] = self._api_token
+            super(PooledFlashArray, self)._start_session()
+
+    def close(self):
+        """ End the REST API session and close any open connections."""
+        try:
+            self.invalidate_cookie()
+        finally:
+            self._session.close()
+
+
+def get_array(target, username=None, password=None, api_token=None, **kwargs):
+    """ Get an authenticated FlashArray for the target, re-using an existing one when possible.
+
+    Args:
+        target (str): The FlashArray management IP or hostname.
+        username (str): Username for management access to the FlashArray.
+        password (str): Password for management access to the FlashArray.
+        api_token (str): API token to use instead of the username and password.
+        **kwargs: Extra arguments for the FlashArray, only used when a new session is created.
+
+    Returns:
+        FlashArray: A logged in FlashArray shared by every caller asking for the same target
+                    with the same credentials.
+    """
+    key = _key(target, username, password if username else api_token)
+    with _lock:
+        array = _sessions.get(key)
+        if array is not None:
+            return array
+        if not api_token:
+            api_token = _api_tokens.get(key)
+
+    # Log in without holding the lock so sessions to other arrays can be set up meanwhile.
+    array = PooledFlashArray(target, username=username, password=password,
+                             api_token=api_token, **kwargs)
+    with _lock:
+        if username:
+            _api_tokens[key] = array._api_token
+        return _sessions.setdefault(key, array)
+
+
+def close_all():
+    """ Close every cached FlashArray session."""
+    with _lock:
+        arrays = list(_sessions.values())
+        _sessions.clear()
+    for array in arrays:
+        try:
+            array.close()
+        except purestorage.PureError:
+            # The session is going away either way.
+            pass
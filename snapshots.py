@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+
+import hosts
+
+# The space_info values we keep track of between runs.
+SPACE_KEYS = ('capacity', 'total', 'data_reduction', 'total_reduction')
+
+
+def take(data):
+    """ Boil the data gathered by health_check.collect() down to a compact snapshot.
+
+    Args:
+        data (dict): The array information as returned by health_check.collect().
+
+    Returns:
+        dict: Plain values only, so the snapshot can be saved as JSON.
+    """
+    host_index = data['host_index']
+    return {
+        'space': dict((key, data['space_info'][key]) for key in SPACE_KEYS),
+        'total_allocated': data['total_allocated'],
+        'messages': dict((str(message['id']), message) for message in data['open_messages']),
+        'hosts': dict((hostname, {
+            'vols': sorted(conn.vol for conn in host_index.host_connections[hostname]),
+            'controllers': sorted(host_index.host_controllers[hostname]),
+        }) for hostname in host_index.names),
+    }
+
+
+def load(path):
+    """ Load the snapshot saved at path, or return None if there isn't one yet."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save(path, snapshot):
+    """ Save the snapshot to path, replacing the previous one in a single step."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as state_file:
+        json.dump(snapshot, state_file, separators=(',', ':'))
+    os.rename(tmp_path, path)
+
+
+def _non_redundant(host):
+    # Same rule as the health report, hosts without any ports are disconnected rather than at risk.
+    return bool(host['controllers']) and not hosts.is_redundant(host['controllers'])
+
+
+def diff(old, new):
+    """ Work out what changed between two snapshots.
+
+    Args:
+        old (dict): The snapshot from the previous run.
+        new (dict): The snapshot from this run.
+
+    Returns:
+        dict: Only the changes. new_messages and cleared_messages hold the alerts that opened
+              or closed, new_hosts and removed_hosts the hosts that came and went,
+              non_redundant_hosts and redundant_hosts the hosts that lost or regained
+              redundancy, and space the (old, new) values that changed.
+    """
+    old_hosts = old['hosts']
+    new_hosts = new['hosts']
+    space = dict((key, (old['space'][key], new['space'][key]))
+                 for key in SPACE_KEYS if old['space'][key] != new['space'][key])
+    if old['total_allocated'] != new['total_allocated']:
+        space['total_allocated'] = (old['total_allocated'], new['total_allocated'])
+
+    return {
+        'new_messages': [message for message_id, message in sorted(new['messages'].items())
+                         if message_id not in old['messages']],
+        'cleared_messages': [message for message_id, message in sorted(old['messages'].items())
+                             if message_id not in new['messages']],
+        'new_hosts': sorted(set(new_hosts) - set(old_hosts)),
+        'removed_hosts': sorted(set(old_hosts) - set(new_hosts)),
+        'non_redundant_hosts': sorted(name for name, host in new_hosts.items() if _non_redundant(host)
+                                      and not (name in old_hosts and _non_redundant(old_hosts[name]))),
+        'redundant_hosts': sorted(name for name, host in new_hosts.items() if not _non_redundant(host)
+                                  and name in old_hosts and _non_redundant(old_hosts[name])),
+        'space': space,
+    }
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+from concurrent import futures
+
+# Re-using our modules
+import batch
+import hosts
+import profiling
+import volumes
+
+
+# Recorded for a step that wasn't run because a step it depends on failed.
+Skipped = batch.Skipped
+
+
+# How each kind of step is run, all called as func(array, *args). The volume steps are the ones
+# smarter_delete takes, so they accept the same errors saying the work was already done.
+STEPS = {
+    'disconnect': volumes.SMARTER_DELETE_STEPS['disconnect'],
+    'disconnect_hgroup': volumes.ignoring(lambda array, hgroup, vol_name: array.disconnect_hgroup(hgroup, vol_name),
+                                          'is not connected'),
+    'destroy_volume': volumes.SMARTER_DELETE_STEPS['destroy'],
+    'eradicate_volume': volumes.SMARTER_DELETE_STEPS['eradicate'],
+    'delete_host': volumes.ignoring(hosts.delete, 'does not exist'),
+}
+
+
+class Plan(object):
+    """ The steps to tear down a set of volumes and hosts, and what each step has to wait for.
+
+    Steps are tuples like ('disconnect', host, vol), ('disconnect_hgroup', hgroup, vol),
+    ('destroy_volume', vol), ('eradicate_volume', vol) and ('delete_host', host).
+
+    Attributes:
+        steps (list): Every step, each listed after all the steps it depends on.
+        depends_on (dict): Step to the list of steps that have to succeed before it can run.
+        blockers (list): Why some of the objects asked for were left out of the plan.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.depends_on = dict()
+        self.blockers = []
+
+    def add(self, step, depends_on=()):
+        if step not in self.depends_on:
+            self.steps.append(step)
+            self.depends_on[step] = list(depends_on)
+        return step
+
+    def waves(self):
+        """ Group the steps into waves, every step of a wave can run as soon as the waves before it are done."""
+        wave_of = dict()
+        waves = []
+        for step in self.steps:
+            wave = 1 + max([wave_of[dep] for dep in self.depends_on[step]] or [-1])
+            wave_of[step] = wave
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(step)
+        return waves
+
+
+def plan(array, vol_names=(), host_names=(), eradicate=True):
+    """ Work out every step needed to remove the volumes and hosts, from a single listing of connections.
+
+    Volumes are disconnected from all their hosts and host groups, destroyed and (optionally)
+    eradicated. Hosts have all their volumes disconnected and are then deleted, the volumes stay
+    unless they are being removed too. Hosts that don't exist are left out, and so are hosts in
+    a host group, since disconnecting the group's volumes would take them from the other hosts
+    too. Those are listed in the plan's blockers.
+
+    Args:
+        array (FlashArray): The target FlashArray.
+        vol_names (iterable): Names of the volumes to remove.
+        host_names (iterable): Names of the hosts to delete.
+        eradicate (bool): Whether to eradicate the volumes after destroying them.
+
+    Returns:
+        Plan: The steps and their dependencies.
+    """
+    # One pass over the hosts and their connections gives us everything we need. Connections
+    # shared through a host group can only be removed from the group, not from each host.
+    vol_hosts = collections.defaultdict(list)
+    vol_hgroups = collections.defaultdict(list)
+    host_vols = dict()
+    host_hgroups = dict()
+    for host in hosts.list_with_connections(array):
+        host_vols[host['name']] = [conn['vol'] for conn in host['connections'] if not conn['hgroup']]
+        host_hgroups[host['name']] = host['hgroup']
+        for conn in host['connections']:
+            if not conn['hgroup']:
+                vol_hosts[conn['vol']].append(host['name'])
+            elif conn['hgroup'] not in vol_hgroups[conn['vol']]:
+                vol_hgroups[conn['vol']].append(conn['hgroup'])
+
+    with profiling.stage('teardown.plan'):
+        result = Plan()
+        for vol in vol_names:
+            disconnects = ([result.add(('disconnect', host, vol)) for host in vol_hosts[vol]] +
+                           [result.add(('disconnect_hgroup', hgroup, vol)) for hgroup in vol_hgroups[vol]])
+            destroy = result.add(('destroy_volume', vol), disconnects)
+            if eradicate:
+                result.add(('eradicate_volume', vol), [destroy])
+
+        for host in host_names:
+            if host not in host_vols:
+                continue
+            if host_hgroups[host]:
+                result.blockers.append('Host {host} is in host group {hgroup}, remove it from the group '
+                                       'first'.format(host=host, hgroup=host_hgroups[host]))
+                continue
+            disconnects = [result.add(('disconnect', host, vol)) for vol in host_vols[host]]
+            result.add(('delete_host', host), disconnects)
+    return result
+
+
+def format_plan(plan):
+    """ Render a Plan as the waves of steps that would run, for a dry run."""
+    counts = collections.Counter(step[0] for step in plan.steps)
+    lines = ['Plan: {count} steps ({kinds})'.format(
+        count=len(plan.steps), kinds=', '.join('{0} {1}'.format(count, kind) for kind, count in counts.items()))]
+    for number, wave in enumerate(plan.waves(), 1):
+        lines.append('')
+        lines.append('Wave {number}, {count} steps in parallel:'.format(number=number, count=len(wave)))
+        for step in wave:
+            lines.append('    ' + ' '.join(step))
+    if plan.blockers:
+        lines.append('')
+        lines.append('Left out:')
+        lines.extend('    ' + blocker for blocker in plan.blockers)
+    return '\n'.join(lines)
+
+
+def execute(array, plan, workers=batch.DEFAULT_WORKERS, rate=None):
+    """ Run a Plan, every step starting as soon as the steps it depends on have succeeded.
+
+    Independent branches, like the steps for different volumes, run in parallel. When a step
+    fails everything that depends on it is skipped, the other branches carry on.
+
+    Args:
+        array (FlashArray): The target FlashArray.
+        plan (Plan): The plan to run, as returned by plan().
+        workers (int): The maximum number of steps to run at once.
+        rate (float): The maximum number of steps to start per second, or None for no limit.
+
+    Returns:
+        OrderedDict: Each step mapped to None if it succeeded, or the exception it raised
+                     (Skipped for steps that never ran), in plan order.
+    """
+    limiter = batch.RateLimiter(rate)
+    waiting_on = dict((step, len(deps)) for step, deps in plan.depends_on.items())
+    dependents = collections.defaultdict(list)
+    for step, deps in plan.depends_on.items():
+        for dep in deps:
+            dependents[dep].append(step)
+
+    def run(step):
+        limiter.wait()
+        STEPS[step[0]](array, *step[1:])
+
+    def skip(step, reason):
+        for dependent in dependents[step]:
+            if dependent not in results:
+                results[dependent] = Skipped(reason)
+                skip(dependent, reason)
+
+    results = dict()
+    with futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        running = dict((executor.submit(run, step), step) for step in plan.steps if not waiting_on[step])
+        while running:
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                results[step] = future.exception()
+                if results[step] is not None:
+                    skip(step, 'after {step} failed'.format(step=' '.join(step)))
+                    continue
+                for dependent in dependents[step]:
+                    waiting_on[dependent] -= 1
+                    if not waiting_on[dependent] and dependent not in results:
+                        running[executor.submit(run, dependent)] = dependent
+
+    return collections.OrderedDict((step, results.get(step)) for step in plan.steps)
+
+
+def main(args):
+    # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+    # With the array is done through these objects, we get ours from the shared session cache.
+    import sessions
+    array = sessions.get_array(args.target, username=args.username, password=args.password)
+
+    vol_names = list(args.volumes or [])
+    if args.volume_pattern:
+        vol_names.extend(volumes.match(array, args.volume_pattern))
+    teardown = plan(array, vol_names, args.hosts or [], not args.no_eradicate)
+
+    print('')
+    print(format_plan(teardown))
+    print('')
+    if args.dry_run:
+        return
+
+    results = execute(array, teardown, args.workers, args.rate)
+    failures = [(step, error) for step, error in results.items() if error is not None]
+    for step, error in failures:
+        print('{status} {step}: {error}'.format(status='Skipped' if isinstance(error, Skipped) else 'Failed',
+                                                step=' '.join(step), error=error))
+    print('{succeeded} succeeded, {failed} failed or skipped.'.format(succeeded=len(results) - len(failures),
+                                                                      failed=len(failures)))
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    # Generic arguments to connect to the array
+    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+
+    # What to tear down
+    parser.add_argument('-v', '--volumes', nargs='+', help='Volumes to disconnect, destroy and eradicate.')
+    parser.add_argument('--volume_pattern', help='Also tear down all volumes matching this pattern (like "test-*").')
+    parser.add_argument('--hosts', nargs='+', help='Hosts to disconnect from all their volumes and delete.')
+    parser.add_argument('--no_eradicate', action='store_true', help="Destroy volumes but don't eradicate them.")
+    parser.add_argument('-n', '--dry_run', action='store_true', help='Only show the plan, change nothing.')
+
+    parser.add_argument('--workers', type=int, default=batch.DEFAULT_WORKERS,
+                        help='Maximum number of steps to run at once.')
+    parser.add_argument('--rate', type=float, help='Maximum number of steps to start per second.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    profiling.run(main, args)
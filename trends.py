@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2016 Pure Storage, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import array
+import bisect
+import contextlib
+import math
+import mmap
+import os
+import time
+from urllib import parse
+
+# Re-using our modules
+import array_info
+import output
+import paging
+import profiling
+
+DAY = 86400
+
+# Every sample is a fixed-width record of three doubles: when it was taken, the bytes used
+# and the size it is growing towards (usable capacity for an array, provisioned size for a
+# volume). Doubles hold byte counts exactly up to 8 PiB. Records are in native byte order.
+FIELDS = 3
+RECORD_SIZE = array.array('d').itemsize * FIELDS
+
+# Each series is kept at these (resolution in seconds, maximum age in seconds) tiers. Samples
+# older than a tier's maximum age are averaged down into the next tier, and the last tier
+# drops samples older than its maximum age, or keeps them forever with None.
+RETENTION = [
+    (60, 7 * DAY),
+    (3600, 90 * DAY),
+    (DAY, None),
+]
+
+# The file name of the array wide series in each array's directory.
+ARRAY_SERIES = 'space'
+
+
+def _series_path(store, array_name, volume, resolution):
+    # Names are quoted so pod volumes like "pod::vol" still make valid file names.
+    directory = os.path.join(store, parse.quote(array_name, safe=''))
+    if volume is None:
+        name = ARRAY_SERIES
+    else:
+        directory = os.path.join(directory, 'volumes')
+        name = parse.quote(volume, safe='')
+    return os.path.join(directory, '{name}.{resolution}'.format(name=name, resolution=resolution))
+
+
+@contextlib.contextmanager
+def _mapped(path):
+    """ Memory-map a series file as a flat sequence of doubles, FIELDS per record.
+
+    A missing file reads as an empty series, and a partly written record at the end
+    (from a crash while appending) is left out.
+    """
+    try:
+        series_file = open(path, 'rb')
+    except FileNotFoundError:
+        yield memoryview(b'').cast('d')
+        return
+    with series_file:
+        size = os.fstat(series_file.fileno()).st_size // RECORD_SIZE * RECORD_SIZE
+        if not size:
+            yield memoryview(b'').cast('d')
+            return
+        with mmap.mmap(series_file.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as raw, raw.cast('d') as values:
+                yield values
+
+
+def _append(path, records):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'ab') as series_file:
+        series_file.write(array.array('d', records).tobytes())
+
+
+def append(store, array_name, samples, timestamp=None):
+    """ Append one sample per series to the finest tier of the store.
+
+    Args:
+        store (str): Directory holding the trend store, created if needed.
+        array_name (str): Name of the FlashArray the samples were taken from.
+        samples (iterable): (volume, used, size) tuples, with volume None for the array itself.
+        timestamp (float): When the samples were taken, now by default.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    resolution = RETENTION[0][0]
+    for volume, used, size in samples:
+        _append(_series_path(store, array_name, volume, resolution), (timestamp, used or 0, size or 0))
+
+
+def record(array, store, array_name=None, include_volumes=True, timestamp=None):
+    """ Sample the space used by a FlashArray, and optionally each of its volumes, into the store.
+
+    Args:
+        array (FlashArray): The FlashArray to sample.
+        store (str): Directory holding the trend store.
+        array_name (str): Name to file the samples under, looked up on the array by default.
+        include_volumes (bool): Whether to sample every volume as well as the array.
+        timestamp (float): When the samples were taken, now by default.
+
+    Returns:
+        int: The number of samples written.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    if array_name is None:
+        array_name = array_info.basic_info(array)['array_name']
+
+    space = array_info.space_info(array)
+    samples = [(None, space['total'], space['capacity'])]
+    if include_volumes:
+        samples.extend((vol['name'], vol['total'], vol['size'])
+                       for vol in paging.iter_pages(array.list_volumes, space=True))
+
+    with profiling.stage('trends.append'):
+        append(store, array_name, samples, timestamp)
+    return len(samples)
+
+
+def _downsample(values, resolution):
+    # Average every field of the records falling in the same resolution wide bucket.
+    records = []
+    bucket = None
+    sums = [0.0] * FIELDS
+    count = 0
+    for i in range(0, len(values), FIELDS):
+        record_bucket = values[i] // resolution
+        if record_bucket != bucket and count:
+            records.extend(total / count for total in sums)
+            sums = [0.0] * FIELDS
+            count = 0
+        bucket = record_bucket
+        for field in range(FIELDS):
+            sums[field] += values[i + field]
+        count += 1
+    if count:
+        records.extend(total / count for total in sums)
+    return records
+
+
+def _split(path, cutoff):
+    # Returns the records before cutoff and the raw bytes of the ones from cutoff on.
+    with _mapped(path) as values:
+        cut = bisect.bisect_left(values[0::FIELDS], cutoff) * FIELDS
+        if not cut:
+            return None, None
+        return array.array('d', values[:cut]), values[cut:].tobytes()
+
+
+def _rewrite(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as series_file:
+        series_file.write(data)
+    os.rename(tmp_path, path)
+
+
+def compact_series(store, array_name, volume=None, now=None, retention=RETENTION):
+    """ Move the samples of one series that are past their tier's maximum age down a tier.
+
+    Cut off points are aligned to the next tier's resolution, so a bucket is never averaged
+    from part of its samples. The next tier is written before the samples are removed from
+    this one, a crash in between leaves a few samples counted twice rather than lost.
+    """
+    now = time.time() if now is None else now
+    for (resolution, max_age), (next_resolution, _) in zip(retention, retention[1:]):
+        path = _series_path(store, array_name, volume, resolution)
+        cutoff = (now - max_age) // next_resolution * next_resolution
+        old, keep = _split(path, cutoff)
+        if old is None:
+            continue
+        _append(_series_path(store, array_name, volume, next_resolution), _downsample(old, next_resolution))
+        _rewrite(path, keep)
+
+    resolution, max_age = retention[-1]
+    if max_age is not None:
+        path = _series_path(store, array_name, volume, resolution)
+        old, keep = _split(path, now - max_age)
+        if old is not None:
+            _rewrite(path, keep)
+
+
+def list_series(store, array_names=None):
+    """ Iterate over the (array_name, volume) pairs with samples in the store.
+
+    Args:
+        store (str): Directory holding the trend store.
+        array_names (list): Only these arrays, or every array in the store with None.
+
+    Yields:
+        tuple: (array_name, volume), with volume None for the array wide series.
+    """
+    if not os.path.isdir(store):
+        return
+    for entry in sorted(os.listdir(store)):
+        array_name = parse.unquote(entry)
+        if array_names and array_name not in array_names:
+            continue
+        yield array_name, None
+        volume_dir = os.path.join(store, entry, 'volumes')
+        if os.path.isdir(volume_dir):
+            volumes = set(name.rsplit('.', 1)[0] for name in os.listdir(volume_dir) if not name.endswith('.tmp'))
+            for volume in sorted(volumes):
+                yield array_name, parse.unquote(volume)
+
+
+def compact(store, array_names=None, now=None, retention=RETENTION):
+    """ Run compact_series() on every series in the store.
+
+    Returns:
+        int: The number of series looked at.
+    """
+    count = 0
+    for array_name, volume in list(list_series(store, array_names)):
+        compact_series(store, array_name, volume, now, retention)
+        count += 1
+    return count
+
+
+def _window_stats(values, start):
+    # Count, means, and centered sums of squares and products of the samples from start on.
+    # Times are taken relative to the first sample before anything is added up, sums of raw
+    # Unix timestamps cancel out and lose most of their precision.
+    times = values[0::FIELDS]
+    first = bisect.bisect_left(times, start)
+    count = len(times) - first
+    if not count:
+        return (0, 0.0, 0.0, 0.0, 0.0), None
+    origin = times[first]
+    offsets = [t - origin for t in times[first:]]
+    used = values[1::FIELDS][first:]
+    mean_offset = math.fsum(offsets) / count
+    mean_used = math.fsum(used) / count
+    spread = math.fsum((t - mean_offset) ** 2 for t in offsets)
+    covariance = math.fsum((t - mean_offset) * (u - mean_used) for t, u in zip(offsets, used))
+    return (count, origin + mean_offset, mean_used, spread, covariance), tuple(values[-FIELDS:])
+
+
+def _merge_stats(a, b):
+    # Combine the stats of two sets of samples, as if they had been computed over both at once.
+    count_a, mean_t_a, mean_used_a, spread_a, covariance_a = a
+    count_b, mean_t_b, mean_used_b, spread_b, covariance_b = b
+    count = count_a + count_b
+    if not count_a or not count_b:
+        return a if count_a else b
+    delta_t = mean_t_b - mean_t_a
+    delta_used = mean_used_b - mean_used_a
+    weight = float(count_a) * count_b / count
+    return (count,
+            mean_t_a + delta_t * count_b / count,
+            mean_used_a + delta_used * count_b / count,
+            spread_a + spread_b + delta_t * delta_t * weight,
+            covariance_a + covariance_b + delta_t * delta_used * weight)
+
+
+def growth(store, array_name, volume=None, window=30 * DAY, now=None, retention=RETENTION):
+    """ Fit a straight line through the space used by one series over a recent window.
+
+    Samples from every tier that fall in the window are used, so a long window is answered
+    from the coarse tiers without reading months of minute samples.
+
+    Args:
+        store (str): Directory holding the trend store.
+        array_name (str): The FlashArray the series belongs to.
+        volume (str): The volume, or None for the array as a whole.
+        window (float): How many seconds back from now to fit over.
+        now (float): The end of the window, now by default.
+
+    Returns:
+        dict: used and size from the latest sample, last_sample (its timestamp), samples in the
+              window, growth_per_day in bytes and days_to_full (None when not growing), or None
+              if there are no samples in the window.
+    """
+    now = time.time() if now is None else now
+    start = now - window
+    totals = (0, 0.0, 0.0, 0.0, 0.0)
+    latest = None
+    for resolution, _ in retention:
+        with _mapped(_series_path(store, array_name, volume, resolution)) as values:
+            stats, last = _window_stats(values, start)
+        totals = _merge_stats(totals, stats)
+        if last is not None and (latest is None or last[0] > latest[0]):
+            latest = last
+
+    count, _, _, spread, covariance = totals
+    if not count:
+        return None
+
+    slope = 0.0
+    if count > 1 and spread > 0:
+        slope = covariance / spread
+
+    last_sample, used, size = latest
+    growth_per_day = slope * DAY
+    days_to_full = None
+    if growth_per_day > 0:
+        days_to_full = max(0.0, (size - used) / growth_per_day)
+    return {
+        'array': array_name,
+        'volume': volume,
+        'last_sample': last_sample,
+        'samples': count,
+        'used': int(used),
+        'size': int(size),
+        'growth_per_day': growth_per_day,
+        'days_to_full': days_to_full,
+    }
+
+
+def forecast(store, array_names=None, include_volumes=True, window=30 * DAY, now=None):
+    """ Run growth() for every series in the store, soonest to fill up first.
+
+    Series without samples in the window, like volumes deleted since, are left out.
+
+    Returns:
+        list: The dicts returned by growth().
+    """
+    results = []
+    with profiling.stage('trends.forecast'):
+        for array_name, volume in list_series(store, array_names):
+            if volume is not None and not include_volumes:
+                continue
+            result = growth(store, array_name, volume, window, now)
+            if result is not None:
+                results.append(result)
+    results.sort(key=lambda result: (result['days_to_full'] is None, result['days_to_full'] or 0))
+    return results
+
+
+def format_forecast(results):
+    """ Render the results of forecast() as a table."""
+    lines = ['{0:<20} {1:<30} {2:>12} {3:>12} {4:>14} {5:>12}'.format(
+        'array', 'volume', 'used GB', 'size GB', 'growth GB/day', 'days to full')]
+    for result in results:
+        days = '-' if result['days_to_full'] is None else '{0:.1f}'.format(result['days_to_full'])
+        lines.append('{0:<20} {1:<30} {2:>12.1f} {3:>12.1f} {4:>14.3f} {5:>12}'.format(
+            result['array'], result['volume'] or '(array)', result['used'] / 1024.0 ** 3,
+            result['size'] / 1024.0 ** 3, result['growth_per_day'] / 1024.0 ** 3, days))
+    return '\n'.join(lines)
+
+
+def main(args):
+    if args.action == 'record':
+        if not (args.target and args.username and args.password):
+            print('The record action needs --target, --username and --password')
+            return
+
+        # The FlashArray object is the main entry point for the Python Rest Client. All interaction
+        # With the array is done through these objects, we get ours from the shared session cache.
+        import sessions
+        array = sessions.get_array(args.target, username=args.username, password=args.password)
+        array_name = array_info.basic_info(array)['array_name']
+
+        last_compact = 0
+        while True:
+            started = time.time()
+            count = record(array, args.store, array_name, not args.no_volumes, started)
+            print('Recorded {count} samples for {name}'.format(count=count, name=array_name))
+            if started - last_compact >= RETENTION[1][0]:
+                compact(args.store, [array_name], started)
+                last_compact = started
+            if not args.interval:
+                break
+            time.sleep(max(0.0, args.interval - (time.time() - started)))
+
+    elif args.action == 'compact':
+        count = compact(args.store, args.array)
+        print('Compacted {count} series'.format(count=count))
+
+    elif args.action == 'forecast':
+        results = forecast(args.store, args.array, not args.no_volumes, args.window_days * DAY)
+        if args.top:
+            results = results[:args.top]
+        if args.format != 'text':
+            output.write_records(results, args.format)
+        else:
+            print(format_forecast(results))
+
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
+    parser.add_argument('action', choices=['record', 'compact', 'forecast'],
+                        help='Sample an array into the store, compact the store, or forecast from it.')
+    parser.add_argument('-s', '--store', required=True, help='Directory holding the trend store.')
+
+    # Arguments to connect to the array for the record action
+    parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.')
+    parser.add_argument('-u', '--username', help='username for management access to FlashArray')
+    parser.add_argument('-p', '--password', help='Password for management access to FlashArray.')
+    parser.add_argument('--interval', type=float,
+                        help='Keep recording, a sample every this many seconds. Records once by default.')
+
+    parser.add_argument('-a', '--array', nargs='*', help='Only compact or forecast these arrays.')
+    parser.add_argument('--no_volumes', action='store_true', help='Only record or forecast the array as a whole.')
+    parser.add_argument('--window_days', type=float, default=30, help='Days of history to fit the growth over.')
+    parser.add_argument('--top', type=int, help='Only show this many series, soonest to fill up first.')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the forecast.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    profiling.run(main, args)
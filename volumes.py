@@ -15,17 +15,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-# For demo purposes we just turn off the HTTPS warnings.
-# With real usage setting up the certificates for secure
-# requests is highly recommended.
-import requests.packages.urllib3
-requests.packages.urllib3.disable_warnings()
-
 import argparse
+import array as pyarray
+import collections
+import fnmatch
+import heapq
+import math
 import pprint
+from concurrent import futures
+
+# Optional read cache on top of the FlashArray sessions, which are only imported once we connect
+import cache
+
+# Helpers for running many volume operations concurrently and paging through long lists
+import batch
+import paging
 
-# Import the python rest-client in the python 3.x style
-from purestorage import purestorage
+# Machine readable output and profiling
+import output
+import profiling
 
 def list_all(array, pending):
     """ List all volumes the FlashArray passed to us.
@@ -35,10 +43,23 @@ def list_all(array, pending):
         pending (bool): Whether or not to list volumes that are pending eradication.
 
     Returns:
-        None
+        list: A dictionary for each volume on the FlashArray.
     """
     return array.list_volumes(pending=pending)
 
+def iter_all(array, pending, page_size=paging.DEFAULT_PAGE_SIZE):
+    """ Iterate over all volumes on the FlashArray passed to us, fetching them a page at a time.
+
+    Args:
+        array (FlashArray): The target FlashArray where we retrieve the volume information.
+        pending (bool): Whether or not to list volumes that are pending eradication.
+        page_size (int): The number of volumes to fetch per REST call.
+
+    Yields:
+        dict: A dictionary for each volume on the FlashArray.
+    """
+    return paging.iter_pages(array.list_volumes, page_size=page_size, pending=pending)
+
 def create(array, vol_name, size):
     """ Create a new volume on the FlashArray passed to us.
 
@@ -77,7 +98,54 @@ def eradicate(array, vol_name):
     """
     array.eradicate_volume(vol_name)
 
-def smarter_delete(array, vol_name):
+def ignoring(step, *texts):
+    """ Wrap a step so an HTTP 400 error containing one of the texts counts as success.
+
+    Used for the errors that mean a step had already been done, like disconnecting a host
+    that is not connected any more.
+
+    Args:
+        step (callable): The step, called as step(array, *args).
+        texts (str): Parts of the error messages to accept.
+
+    Returns:
+        callable: The step, taking the same arguments.
+    """
+    def run(array, *args):
+        # Import the python rest-client in the python 3.x style
+        from purestorage import purestorage
+        try:
+            return step(array, *args)
+        except purestorage.PureHTTPError as err:
+            if not (err.code == 400 and any(text in err.text for text in texts)):
+                raise
+    return run
+
+# The steps of smarter_delete, all called as func(array, *args). Each treats the errors saying
+# its work is already done as a success: a host and volume that are no longer connected
+# (somehow), or a volume that is already destroyed or gone.
+SMARTER_DELETE_STEPS = {
+    'disconnect': ignoring(lambda array, host_name, vol_name: array.disconnect_host(host_name, vol_name),
+                           'is not connected'),
+    'destroy': ignoring(destroy, 'does not exist', 'has been destroyed'),
+    'eradicate': ignoring(eradicate, 'does not exist'),
+}
+
+def smarter_delete_steps(array, vol_name):
+    """ List the steps smarter_delete takes for a volume, as [step, *args] lists of SMARTER_DELETE_STEPS.
+
+    Args:
+        array (FlashArray): The target FlashArray where we will destroy the volume.
+        vol_name (str): The name of the volume to be destroyed.
+
+    Returns:
+        list: A disconnect step for each host the volume is connected to, then destroy and eradicate.
+    """
+    connected_hosts = array.list_volume_private_connections(vol_name)
+    return ([['disconnect', host_info['host'], vol_name] for host_info in connected_hosts] +
+            [['destroy', vol_name], ['eradicate', vol_name]])
+
+def smarter_delete(array, vol_name, strict=False):
     """ Clean up and then delete a volume object.
 
     This will destroy and eradicate the volume object, but only after clearing host connections.
@@ -86,45 +154,304 @@ def smarter_delete(array, vol_name):
     Args:
         array (FlashArray): The target FlashArray where we will destroy the volume.
         vol_name (str): The name of the volume to be destroyed.
+        strict (bool): Raise the errors that don't mean the work was already done, instead of
+                       suppressing them. Bulk runs use this so failures show up in their summary.
 
     Returns:
         None
     """
-    # Lets start by clearing any host connections this volume might have
-    connected_hosts = array.list_volume_private_connections(vol_name)
+    # Import the python rest-client in the python 3.x style
+    from purestorage import purestorage
 
-    for host_info in connected_hosts:
-        host_name = host_info["host"]
+    # Lets start by clearing any host connections this volume might have, then delete our volume
+    for step in smarter_delete_steps(array, vol_name):
         try:
-            array.disconnect_host(host_name, vol_name)
-        except purestorage.PureHTTPError as err:
-            if err.code == 400 and 'is not connected' in err.text:
-                # Ignore this HTTP 400 error, since we are trying to disconnect the host
-                # if it fails with an error message saying 'is not connected' we can
-                # treat that as a success (the volume and host are no longer connected...somehow)
-                pass
-    
-    # Now we can try and delete our volume
-    try:
-        array.destroy_volume(vol_name)
-        array.eradicate_volume(vol_name)
-    except purestorage.PureHTTPError as err:
-            if err.code == 400 and 'does not exist' in err.text or 'has been destroyed' in err.text:
-                # Ignore this HTTP 400 error. If the volume is already destroyed our work here is done.
-                pass
+            SMARTER_DELETE_STEPS[step[0]](array, *step[1:])
+        except purestorage.PureHTTPError:
+            if strict:
+                raise
+
+# The single volume helpers that can be run in bulk, all take (array, vol_name).
+BULK_ACTIONS = {
+    'destroy': destroy,
+    'eradicate': eradicate,
+    'smarter_delete': lambda array, vol_name: smarter_delete(array, vol_name, strict=True),
+}
+
+def match(array, pattern, pending=False, pending_only=False):
+    """ Find the names of the volumes on the FlashArray matching a shell-style pattern.
+
+    Args:
+        array (FlashArray): The target FlashArray where we retrieve the volume information.
+        pattern (str): A pattern like 'db-*' or 'test-vol-?'.
+        pending (bool): Whether or not to include volumes that are pending eradication.
+        pending_only (bool): Only match volumes that are pending eradication.
+
+    Returns:
+        list: The names of the matching volumes.
+    """
+    if pending_only:
+        vols = paging.iter_pages(array.list_volumes, pending_only=True)
+    else:
+        vols = iter_all(array, pending)
+    return fnmatch.filter((vol['name'] for vol in vols), pattern)
+
+def read_manifest(path, size=None):
+    """ Read a list of volumes from a manifest file.
+
+    Each non-empty line holds a volume name, optionally followed by its size.
+    Lines starting with '#' are ignored.
+
+    Args:
+        path (str): The path to the manifest file.
+        size (str or int): Size to use for volumes that don't list their own.
+
+    Returns:
+        list: A (name, size) tuple for each volume in the manifest.
+    """
+    manifest = []
+    with open(path) as manifest_file:
+        for line in manifest_file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) > 2:
+                raise ValueError('Invalid manifest line: {line}'.format(line=line.strip()))
+            manifest.append((fields[0], fields[1] if len(fields) == 2 else size))
+    return manifest
+
+def bulk_create(array, vols, workers=batch.DEFAULT_WORKERS, rate=None):
+    """ Create many volumes on the FlashArray concurrently.
+
+    Args:
+        array (FlashArray): The target FlashArray where we will create the volumes.
+        vols (list): A (name, size) tuple for each volume to be created.
+        workers (int): The maximum number of volumes to create at once.
+        rate (float): The maximum number of volumes to start creating per second, or None for no limit.
+
+    Returns:
+        OrderedDict: Each volume name mapped to None if it was created or the error raised creating it.
+    """
+    results = batch.run_all(lambda vol: create(array, vol[0], vol[1]), vols, workers, rate)
+    return collections.OrderedDict((vol[0], error) for vol, error in results.items())
+
+def bulk(array, action, vol_names, workers=batch.DEFAULT_WORKERS, rate=None):
+    """ Destroy, eradicate or smarter_delete many volumes on the FlashArray concurrently.
+
+    Each volume still goes through its own steps in order, but the volumes are worked on
+    in parallel so the REST calls for different volumes overlap.
+
+    Args:
+        array (FlashArray): The target FlashArray where we will operate on the volumes.
+        action (str): One of the BULK_ACTIONS.
+        vol_names (list): The names of the volumes to operate on.
+        workers (int): The maximum number of volumes to work on at once.
+        rate (float): The maximum number of volumes to start on per second, or None for no limit.
+
+    Returns:
+        OrderedDict: Each volume name mapped to None if it succeeded or the error raised for it.
+    """
+    func = BULK_ACTIONS[action]
+    return batch.run_all(lambda vol_name: func(array, vol_name), vol_names, workers, rate)
+
+def print_summary(results):
+    """ Print a per volume success/failure summary for the results of a bulk operation."""
+    failures = [(name, error) for name, error in results.items() if error is not None]
+    for name, error in failures:
+        print('Failed on volume "{name}": {error}'.format(name=name, error=error))
+    print('{succeeded} succeeded, {failed} failed.'.format(succeeded=len(results) - len(failures),
+                                                          failed=len(failures)))
+
+
+# Per volume columns collected by collect_stats(), the space ones come from
+# list_volumes(space=True) and the performance ones from list_volumes(action='monitor').
+SPACE_COLUMNS = ('size', 'volumes', 'snapshots', 'total', 'data_reduction', 'total_reduction', 'thin_provisioning')
+PERFORMANCE_COLUMNS = ('reads_per_sec', 'writes_per_sec', 'input_per_sec', 'output_per_sec',
+                       'usec_per_read_op', 'usec_per_write_op')
+
+# The columns the array reports as integers (bytes and counts), they are given back as ints.
+INT_COLUMNS = frozenset(('size', 'volumes', 'snapshots', 'total') + PERFORMANCE_COLUMNS)
+
+# The top-N queries VolumeStats answers: (column, smallest first) for each.
+TOP_QUERIES = {
+    'largest': ('total', False),
+    'reduction': ('data_reduction', True),
+    'latency': ('usec_per_op', False),
+}
+
+
+def _read_columns(pages, columns):
+    # Stream a volume listing straight into typed columns, no dict per volume is kept around.
+    names = []
+    values = dict((column, pyarray.array('d')) for column in columns)
+    for vol in pages:
+        names.append(vol['name'])
+        for column in columns:
+            value = vol.get(column)
+            values[column].append(math.nan if value is None else value)
+    return names, values
+
+
+class VolumeStats(object):
+    """ Space and performance numbers for every volume on a FlashArray, stored a column at a time.
+
+    Each column is a typed array of doubles with one entry per volume, in the order of names,
+    so tens of thousands of volumes cost a few bytes per value rather than a dict each. Values
+    the array didn't report, like performance for a volume created in between the two listings,
+    are NaN and left out of top().
+    """
+
+    def __init__(self, names, columns):
+        self.names = names
+        self.index = dict((name, i) for i, name in enumerate(names))
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, i):
+        """ The values of the volume at position i as a dict, NaN values as None and INT_COLUMNS as ints."""
+        record = {'name': self.names[i]}
+        for column, values in self.columns.items():
+            value = values[i]
+            if math.isnan(value):
+                value = None
+            elif column in INT_COLUMNS:
+                value = int(value)
+            record[column] = value
+        return record
+
+    def rows(self, positions=None):
+        """ Iterate over the volumes as dicts, all of them or the ones at the given positions."""
+        for i in range(len(self.names)) if positions is None else positions:
+            yield self.row(i)
+
+    def top(self, column, count=10, smallest=False):
+        """ Find the positions of the count volumes with the largest (or smallest) value in a column.
+
+        Args:
+            column (str): The column to rank by, like 'total' or 'usec_per_op'.
+            count (int): How many volumes to return.
+            smallest (bool): Rank the smallest values first instead of the largest.
+
+        Returns:
+            list: Positions into names, best ranked first.
+        """
+        values = self.columns[column]
+        # NaN never equals itself, which filters out the missing values.
+        positions = (i for i, value in enumerate(values) if value == value)
+        pick = heapq.nsmallest if smallest else heapq.nlargest
+        return pick(count, positions, key=values.__getitem__)
+
+
+def collect_stats(array, performance=True, page_size=paging.DEFAULT_PAGE_SIZE):
+    """ Collect space and performance numbers for every volume in a couple of paged listings.
+
+    The space and performance listings are fetched at the same time, each a page at a time,
+    instead of making a call per volume.
+
+    Args:
+        array (FlashArray): The target FlashArray where we retrieve the volume information.
+        performance (bool): Whether to collect performance numbers as well as space.
+        page_size (int): The number of volumes to fetch per REST call.
+
+    Returns:
+        VolumeStats: The numbers for every volume, with a usec_per_op column holding the average
+                     latency over reads and writes.
+    """
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        if performance:
+            monitor = executor.submit(_read_columns, paging.iter_pages(
+                array.list_volumes, page_size=page_size, action='monitor'), PERFORMANCE_COLUMNS)
+        names, columns = _read_columns(paging.iter_pages(
+            array.list_volumes, page_size=page_size, space=True), SPACE_COLUMNS)
+        if performance:
+            perf_names, perf_columns = monitor.result()
+
+    with profiling.stage('volumes.VolumeStats'):
+        stats = VolumeStats(names, columns)
+        if performance:
+            # Line the performance columns up with the space ones, the listings may not match exactly.
+            for column in PERFORMANCE_COLUMNS:
+                columns[column] = pyarray.array('d', [math.nan]) * len(names)
+            for perf_i, name in enumerate(perf_names):
+                i = stats.index.get(name)
+                if i is not None:
+                    for column in PERFORMANCE_COLUMNS:
+                        columns[column][i] = perf_columns[column][perf_i]
+
+            reads, writes = columns['reads_per_sec'], columns['writes_per_sec']
+            read_usec, write_usec = columns['usec_per_read_op'], columns['usec_per_write_op']
+            per_op = pyarray.array('d', [math.nan]) * len(names)
+            for i in range(len(names)):
+                ops = reads[i] + writes[i]
+                if ops > 0:
+                    per_op[i] = (reads[i] * read_usec[i] + writes[i] * write_usec[i]) / ops
+            columns['usec_per_op'] = per_op
+    return stats
+
+
+def format_top(stats, positions):
+    """ Render the volumes at the given positions in a VolumeStats as a table."""
+    lines = ['{0:<40} {1:>12} {2:>12} {3:>10} {4:>12}'.format('volume', 'size GB', 'used GB', 'reduction',
+                                                              'usec/op')]
+    for record in stats.rows(positions):
+        lines.append('{0:<40} {1:>12.1f} {2:>12.1f} {3:>10} {4:>12}'.format(
+            record['name'], record['size'] / 1024.0 ** 3, (record['total'] or 0) / 1024.0 ** 3,
+            '-' if record['data_reduction'] is None else '{0:.1f}'.format(record['data_reduction']),
+            '-' if record.get('usec_per_op') is None else '{0:.0f}'.format(record['usec_per_op'])))
+    return '\n'.join(lines)
 
 
 def main(args):
     # The FlashArray object is the main entry point for the Python Rest Client. All interaction
-    # With the array is done through these objects.
-    array = purestorage.FlashArray(args.target, username=args.username, password=args.password)
+    # With the array is done through these objects, we get ours from the shared session cache.
+    import sessions
+    array = sessions.get_array(args.target, username=args.username, password=args.password)
+    if args.cache_file:
+        array = cache.CachedFlashArray(array, path=args.cache_file)
+
+    if args.action == 'top':
+        column, smallest = TOP_QUERIES[args.by]
+        stats = collect_stats(array, performance=args.by == 'latency' or args.format != 'text')
+        with profiling.stage('volumes.top'):
+            positions = stats.top(column, args.top, smallest)
+        if args.format != 'text':
+            output.write_records(stats.rows(positions), args.format)
+        else:
+            print(format_top(stats, positions))
+        if args.cache_file:
+            array.save()
+        return
+
+    if args.action == 'list' and args.format != 'text':
+        # Written straight from the pages as they come in, ndjson is fully streaming.
+        output.write_records(iter_all(array, args.pending), args.format)
+        if args.cache_file:
+            array.save()
+        return
 
     print('')
-    if args.action == 'list':
-        vols = list_all(array, args.pending)
-
-        # We will just iterate through the volumes and print their info.
-        for vol in vols:
+    if (args.manifest or args.pattern) and args.action != 'list':
+        if args.action == 'create':
+            if args.manifest:
+                vols = read_manifest(args.manifest, args.size)
+            else:
+                vols = [(args.pattern.format(i), args.size) for i in range(args.count)]
+            print('Creating {count} volumes...'.format(count=len(vols)))
+            results = bulk_create(array, vols, args.workers, args.rate)
+        elif args.action in BULK_ACTIONS:
+            if args.manifest:
+                vol_names = [name for name, _ in read_manifest(args.manifest)]
+            else:
+                vol_names = match(array, args.pattern, pending_only=args.action == 'eradicate')
+            print('Running {action} on {count} volumes...'.format(action=args.action, count=len(vol_names)))
+            results = bulk(array, args.action, vol_names, args.workers, args.rate)
+        print_summary(results)
+
+    elif args.action == 'list':
+        # We will just iterate through the volumes and print their info as they come in.
+        for vol in iter_all(array, args.pending):
             volume_name = vol['name']
             print('Details for volume "{name}"'.format(name=volume_name))
             pprint.pprint(vol)
@@ -148,27 +475,52 @@ def main(args):
         print('Clearing host connections and then destroying/eradicating volume {name}...'.format(name=args.name))
         smarter_delete(array, args.name)
 
+    if args.cache_file:
+        array.save()
+
     print('Done!')
     print('')
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-
+def add_arguments(parser):
+    """ Add the command line arguments of this module to an argparse parser."""
     # Generic arguments to connect to the array
     parser.add_argument('-t', '--target', help='Target FlashArray management IP or hostname.', required=True)
     parser.add_argument('-u', '--username', help='username for management access to FlashArray', required=True)
     parser.add_argument('-p', '--password', help='Password for management access to FlashArray.', required=True)
+    parser.add_argument('--cache_file', help='File to cache read results in between runs against the same FlashArray.')
     
     # Add an action for what we want to do with volumes
     parser.add_argument('action', help='The action to run',
-                        choices=['create', 'destroy', 'eradicate', 'smarter_delete', 'list'])
+                        choices=['create', 'destroy', 'eradicate', 'smarter_delete', 'list', 'top'])
 
     # Some more specific options
     parser.add_argument('-n', '--name', help='Name of the volume to be operated on or created.'
                                              ' Required for create, destroy, and eradicate.')
     parser.add_argument('-s', '--size', help='Size of the volume to be created.')
     parser.add_argument('--pending', help='List volumes pending eradication.', action='store_true')
+    parser.add_argument('-f', '--format', choices=['text'] + output.FORMATS, default='text',
+                        help='Output format for the list and top actions.')
+    parser.add_argument('--by', choices=sorted(TOP_QUERIES), default='largest',
+                        help='What the top action ranks by: largest consumers, worst data reduction or '
+                             'highest latency.')
+    parser.add_argument('--top', type=int, default=10, help='Number of volumes the top action shows.')
+
+    # Options for operating on many volumes at once
+    parser.add_argument('-m', '--manifest', help='File listing the volumes to operate on, one name'
+                                                 ' (optionally followed by a size for create) per line.')
+    parser.add_argument('--pattern', help='Operate on all volumes matching this pattern (like "test-*"). For'
+                                          ' create this is a format string like "test-{}" used with --count.')
+    parser.add_argument('--count', type=int, default=1, help='Number of volumes to create with --pattern.')
+    parser.add_argument('--workers', type=int, default=batch.DEFAULT_WORKERS,
+                        help='Maximum number of volumes to operate on at once.')
+    parser.add_argument('--rate', type=float, help='Maximum number of volume operations to start per second.')
+
+    parser.add_argument('--profile', action='store_true', help='Print a summary of REST call and processing times.')
+    parser.add_argument('--trace_file', help='Write a Chrome trace of every REST call and processing step to this file.')
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
-    main(args)
+    profiling.run(main, args)